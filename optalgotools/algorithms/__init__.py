@@ -1,2 +1,3 @@
-from ._sa import SimulatedAnnealing
-from ._ts import TabuSearch
\ No newline at end of file
+from ._sa import SimulatedAnnealing, ParallelSimulatedAnnealing, ParallelTempering, PopulationAnnealing
+from ._ts import TabuSearch
+from ._telemetry import Observer, TelemetryRecorder
@@ -0,0 +1,57 @@
+'''
+Time and evaluation budget shared by the metaheuristics.
+
+The algorithms only compare their evaluation counter with next_check on every step, the clock is
+read in exhausted() and the number of evaluations between two reads adapts so that the clock is
+read about every 1 to 10 ms whatever the cost of an evaluation.
+'''
+from time import perf_counter
+
+
+class Budget:
+    def __init__(self, time_limit=None, max_evaluations=None) -> None:
+        self.time_limit = time_limit if time_limit and time_limit > 0 else None
+        self.max_evaluations = max_evaluations if max_evaluations and max_evaluations > 0 else None
+        self.elapsed = 0
+        self.next_check = float('inf')
+        self.__interval, self.__last_time = 1, None
+
+    def __bool__(self):
+        return not (self.time_limit is None and self.max_evaluations is None)
+
+    def start(self, n_evals=0):
+        self.elapsed = 0
+        self.__interval = 1
+        self.resume(n_evals)
+
+    def resume(self, n_evals=0):
+        # also used after loading a checkpoint, the time spent before it still counts
+        self.__last_time = perf_counter()
+        self.__schedule(n_evals)
+
+    def __schedule(self, n_evals):
+        self.next_check = float('inf')
+        if self.time_limit:
+            self.next_check = n_evals + self.__interval
+        if self.max_evaluations:
+            self.next_check = min(self.next_check, self.max_evaluations)
+
+    def exhausted(self, n_evals):
+        '''
+        Returns 'max_evaluations' or 'time_limit' if the budget is used up, None otherwise
+        '''
+        if self.max_evaluations and n_evals >= self.max_evaluations:
+            return 'max_evaluations'
+        if self.time_limit:
+            now = perf_counter()
+            step = now - self.__last_time
+            self.elapsed += step
+            if step < 0.001:
+                self.__interval *= 2
+            elif step > 0.01 and self.__interval > 1:
+                self.__interval //= 2
+            self.__last_time = now
+            if self.elapsed >= self.time_limit:
+                return 'time_limit'
+        self.__schedule(n_evals)
+        return None
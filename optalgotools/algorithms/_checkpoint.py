@@ -0,0 +1,40 @@
+'''
+Helpers to persist the state of the metaheuristics, so that a long run can be resumed.
+
+A checkpoint is a pickle (highest protocol) of the instance attributes, except the problem
+object which is not saved and has to be given again on resume, together with the state of
+the random and np.random generators and of the problem's own random streams.
+'''
+import os
+import pickle
+import random
+import numpy as np
+
+CHECKPOINT_VERSION = 1
+
+
+def save_state(obj, path, exclude=('problem_obj',)):
+    state = {k: v for k, v in obj.__dict__.items() if k not in exclude}
+    checkpoint = {'version': CHECKPOINT_VERSION, 'class': type(obj).__name__, 'state': state,
+                  'random': random.getstate(), 'np_random': np.random.get_state()}
+    problem = getattr(obj, 'problem_obj', None)
+    if hasattr(problem, 'rng'):
+        checkpoint['problem_random'] = (problem.rng, problem.random)
+    # write then rename, so a preempted save does not corrupt the previous checkpoint
+    tmp_path = str(path) + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_state(obj, path):
+    with open(path, 'rb') as f:
+        checkpoint = pickle.load(f)
+    if checkpoint.get('version') != CHECKPOINT_VERSION or checkpoint.get('class') != type(obj).__name__:
+        raise ValueError(f"{path} is not a {type(obj).__name__} checkpoint (version {CHECKPOINT_VERSION})")
+    obj.__dict__.update(checkpoint['state'])
+    random.setstate(checkpoint['random'])
+    np.random.set_state(checkpoint['np_random'])
+    problem = getattr(obj, 'problem_obj', None)
+    if 'problem_random' in checkpoint and hasattr(problem, 'rng'):
+        problem.rng, problem.random = checkpoint['problem_random']
@@ -0,0 +1,124 @@
+'''
+Long term memory of the tabu search, with a size that does not grow with the run.
+
+FrequencyMemory counts how often each move was taken. It uses a count-min sketch for any
+hashable move, or an exact array for the (i, j) moves of a full neighbourhood scan. PhaseScheduler
+decides when the search intensifies around its best solution and when it diversifies away from
+the moves it has taken most often.
+'''
+import numpy as np
+
+# Mersenne prime of the hash family of the sketch rows
+_PRIME = 2**61 - 1
+
+
+class FrequencyMemory:
+    '''
+    width                   number of counters per row of the count-min sketch, the estimate of
+                            a count is exact until about width distinct moves are taken and never
+                            under-counts after that
+    depth                   number of rows of the sketch, one hash function per row
+    shape                   instead of the sketch, an exact array of counts of this shape whose
+                            keys are index tuples (e.g. the shape of neighbourhood_deltas)
+    decay                   every counter and the total are multiplied by decay every width
+                            updates, so the old moves are forgotten and the total stays below
+                            width / (1 - decay). With None the counts are kept for the whole
+                            run, the error bound of the sketch (see error()) then grows with the
+                            total and more and more of the moves taken count as never taken
+    '''
+    def __init__(self, width=4096, depth=4, shape=None, decay=0.5) -> None:
+        self.width = width if width and width > 0 else 4096
+        self.depth = depth if depth and depth > 0 else 4
+        self.decay = decay if decay and 0 < decay < 1 else None
+        self.shape = shape
+        if shape is None:
+            self.counts = np.zeros((self.depth, self.width))
+            # fixed coefficients, so the same moves hit the same counters in every process
+            coefs = np.random.default_rng(0).integers(1, _PRIME, size=(2, self.depth))
+            self.__coefs = [(int(a), int(b)) for a, b in zip(*coefs)]
+        else:
+            self.counts = np.zeros(shape)
+        self.total = 0
+        self.__updates = 0
+
+    def __cells(self, key):
+        h = hash(key)
+        return [(r, (a * h + b) % _PRIME % self.width) for r, (a, b) in enumerate(self.__coefs)]
+
+    def add(self, key):
+        if self.shape is None:
+            for cell in self.__cells(key):
+                self.counts[cell] += 1
+        else:
+            self.counts[key] += 1
+        self.total += 1
+        self.__updates += 1
+        if self.decay and self.__updates >= self.width:
+            self.counts *= self.decay
+            self.total *= self.decay
+            self.__updates = 0
+
+    def count(self, key):
+        if self.shape is None:
+            return min(self.counts[cell] for cell in self.__cells(key))
+        return self.counts[key]
+
+    def error(self):
+        '''
+        Bound of the over-count of the sketch, an estimate exceeds the true count by more than
+        e * total / width with probability at most exp(-depth), 0 for the exact memory
+        '''
+        return np.e * self.total / self.width if self.shape is None else 0
+
+    def seen(self, key):
+        '''
+        Whether key was taken, the estimates within the error bound of the sketch count as unseen
+        '''
+        return self.count(key) > self.error()
+
+    def frequency(self, key):
+        '''
+        Share of the moves taken that were key, 0 for a move never taken
+        '''
+        return self.count(key) / self.total if self.total else 0
+
+    def frequencies(self):
+        '''
+        Frequencies of all the keys as an array of the given shape (exact memory only)
+        '''
+        if self.shape is None:
+            raise RuntimeError("A count-min sketch can not list its frequencies, give the shape of the moves")
+        return self.counts / self.total if self.total else np.zeros(self.shape)
+
+
+class PhaseScheduler:
+    '''
+    The search intensifies until it has gone stall_iters iterations without improving its best
+    solution. It then diversifies for diversify_iters iterations, and intensifies again starting
+    from its best solution.
+    '''
+    def __init__(self, stall_iters, diversify_iters) -> None:
+        self.stall_iters = stall_iters
+        self.diversify_iters = diversify_iters
+        self.start()
+
+    def start(self, iter=0):
+        self.phase = 'intensify'
+        self.phase_start = iter
+        self.n_switches = 0
+
+    def update(self, iter, iter_best):
+        '''
+        Returns the new phase when the phase changes at iteration iter, None otherwise
+        '''
+        if self.phase == 'intensify':
+            if iter - max(iter_best, self.phase_start) < self.stall_iters:
+                return None
+            self.phase = 'diversify'
+        else:
+            if iter - self.phase_start < self.diversify_iters:
+                return None
+            self.phase = 'intensify'
+        self.phase_start = iter
+        self.n_switches += 1
+        return self.phase
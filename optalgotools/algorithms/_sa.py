@@ -1,21 +1,50 @@
-__all__ = ['SimulatedAnnealing']
+__all__ = ['SimulatedAnnealing', 'ParallelSimulatedAnnealing', 'ParallelTempering', 'PopulationAnnealing']
 
+import os
 import math
-import random
-from copy import deepcopy
-COOLING_SCHEDULES = ['linear', 'geometric', 'logarithmic', 'exponential', 'linear_inverse']
+from copy import copy
+from time import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from ._checkpoint import save_state, load_state
+from ._budget import Budget
+from ..utilities import make_rngs, spawn_seeds
+COOLING_SCHEDULES = ['linear', 'geometric', 'logarithmic', 'exponential', 'linear_inverse', 'adaptive']
 
 
 class SimulatedAnnealing:
 
     def __init__(self, max_iter=1000, max_iter_per_temp=10,
                  initial_temp=5230.0, final_temp=0.1,
-                 cooling_schedule='linear_inverse', cooling_alpha=0.9, debug=0) -> None:
+                 cooling_schedule='linear_inverse', cooling_alpha=0.9, use_moves=True,
+                 precompute=False, initial_acceptance=0.8, reheat_after=None, observers=None,
+                 time_limit=None, max_evaluations=None, tolerance=None, stall_window=None, seed=None, debug=0) -> None:
 
         self.debug = debug
+        # Observer objects (e.g. TelemetryRecorder) notified after every temperature level
+        self.observers = list(observers) if observers else []
+        # score neighbours through the problem's move protocol when it has one
+        self.use_moves = use_moves
+        # precompute the temperature of every iteration and draw the acceptance randoms in blocks
+        self.precompute = precompute
         self.max_iter = max_iter if max_iter > 0 else 1000
         self.max_iter_per_temp = max_iter_per_temp if max_iter_per_temp > 0 else 10
-        self.initial_temp = initial_temp if initial_temp >= 10 else 1000
+        # initial_temp='auto' calibrates it on every init from sampled uphill moves, so that
+        # about initial_acceptance of them would be accepted at the start
+        self.auto_initial_temp = initial_temp == 'auto'
+        self.initial_acceptance = initial_acceptance if 1 > initial_acceptance > 0 else 0.8
+        self.initial_temp = 1000 if self.auto_initial_temp or initial_temp < 10 else initial_temp
+        # after reheat_after temperature updates without a new best, the schedule goes back to
+        # the temperature at which the best was found
+        self.reheat_after = reheat_after if reheat_after and reheat_after > 0 else None
+        # run() stops with the best so far once time_limit seconds or max_evaluations are used,
+        # or after stall_window temperature updates without improving the best by more than
+        # tolerance; with a tolerance, stoping_val is reached at val_best <= stoping_val + tolerance
+        self.budget = Budget(time_limit, max_evaluations)
+        self.tolerance = tolerance if tolerance and tolerance > 0 else None
+        self.stall_window = stall_window if stall_window and stall_window > 0 else None
+        self.stop_reason = None
+        self._stall_val, self._stall_iter = None, 0
         self.final_temp = final_temp if 1 >= final_temp > 0 else 0.1
         
         if cooling_schedule not in COOLING_SCHEDULES:
@@ -28,11 +57,38 @@ class SimulatedAnnealing:
         if self.__cooling_schedule == 'linear_inverse' and self.__cooling_alpha <= 0:
             raise ValueError("For cooling function " + self.__cooling_schedule +
                              ", cooling alpha must be greater than 0")
-        elif self.__cooling_schedule == 'geometric' and 0.8 > self.__cooling_alpha or self.__cooling_alpha > 0.9:
+        elif self.__cooling_schedule == 'geometric' and (0.8 > self.__cooling_alpha or self.__cooling_alpha > 0.9):
             raise ValueError("For cooling function " + self.__cooling_schedule +
                              ", cooling alpha must be in range [0.8, 0.9]")
+        elif self.__cooling_schedule == 'adaptive' and not 0 < self.__cooling_alpha < 1:
+            raise ValueError("For cooling function " + self.__cooling_schedule +
+                             ", cooling alpha must be in range (0, 1)")
 
+        self.__best_pending = False
+        self.__temps, self.__exps = None, []
+        self.__level_evals, self.__level_accepted, self.__iter_offset, self.__best_k, self.__best_t = [0] * 5
+        self.n_evals, self.n_accepted = 0, 0
+        self.acceptance_ratio, self.reheats = None, 0
+        self.__rep, self.__repetition = 0, 1
+        self.checkpoint_path, self.checkpoint_every = None, None
         self.t, self.iter, self.s_best, self.val_best, self.s_allbest, self.val_allbest, self.s_cur, self.val_cur, self.problem_obj = [None]*9
+        # with a seed every run() reseeds the annealer and the problem, so it can be repeated
+        self.seed = seed
+        self.seed_rng(seed)
+
+    # With in-place moves the best solution is only copied out of s_cur when s_cur is about
+    # to move away from it (or when s_best is read), not on every improvement.
+    @property
+    def s_best(self):
+        if self.__best_pending:
+            self.__s_best = self.problem_obj.copy_solution(self.s_cur)
+            self.__best_pending = False
+        return self.__s_best
+
+    @s_best.setter
+    def s_best(self, sol):
+        self.__s_best = sol
+        self.__best_pending = False
 
     def init_annealing(self, problem_obj=None, stoping_val=None, init=None):
         if problem_obj:
@@ -42,74 +98,685 @@ class SimulatedAnnealing:
                 raise RuntimeError("Problem object need to be set!")
 
         self.stoping_val = stoping_val
-        self.t = self.initial_temp
         self.iter = 1
+        self.__moves = self.use_moves and hasattr(self.problem_obj, 'supports_moves') and self.problem_obj.supports_moves()
         if not init is None:
-            self.s_cur = init
+            # moves are applied in place, so the caller's init must not be shared
+            self.s_cur = self.problem_obj.copy_solution(init) if self.__moves else init
         else:
             self.s_cur = self.problem_obj.get_init_solution()
         self.val_cur = self.problem_obj.eval_solution(self.s_cur)
+        if self.auto_initial_temp:
+            self.initial_temp = self.calibrate_initial_temp(self.s_cur)
+        self.t = self.initial_temp
+        self.__iter_offset, self.__best_k = 0, 0
+        self.__level_evals, self.__level_accepted = self.n_evals, self.n_accepted
+        self.__best_t = self.t
+        self._stall_val, self._stall_iter = self.val_cur, self.iter
+        self.acceptance_ratio, self.reheats = None, 0
+        if self.precompute:
+            self.__temps = self.temperature_table().tolist() if self.__cooling_schedule != 'adaptive' else None
+            self.__exps = []
         self.s_best, self.val_best, self.s_allbest, self.val_allbest = [None] * 4
         if self.debug>0:
             print(f"Simulated annealing is initialized:\ncurrent value = {self.val_cur}, current temp={self.t}")
         
+    def set_state(self, s_cur, val_cur, t):
+        '''
+        Continues from s_cur, of value val_cur, at temperature t, with a new best. It skips the
+        evaluation and the tables of init_annealing, which must have been called once before
+        (e.g. the replicas of ParallelTempering between two rounds)
+        '''
+        self.s_cur = self.problem_obj.copy_solution(s_cur) if self.__moves else s_cur
+        self.val_cur = val_cur
+        self.t = t
+        self.s_best, self.val_best = None, None
+        # the exponentials left were drawn from the previous stream
+        self.__exps = []
+
     def annealing_step(self):
         if not self.problem_obj:
             raise RuntimeError("SimulatedAnnealing problem object is not initialized, call init_annealing()")
+        self.n_evals += 1
+        if self.__moves:
+            return self.__annealing_move_step()
         s_cand = self.problem_obj.get_neighbour_solution(self.s_cur)
         val_cand = self.problem_obj.eval_solution(s_cand)
         val_diff = val_cand - self.val_cur
-        if val_diff < 0 or random.random() < math.exp(-1*val_diff/self.t):
-            self.s_cur = deepcopy(s_cand)
-            self.val_cur = deepcopy(val_cand)
+        if val_diff < 0 or (self.__random.random() < math.exp(-1*val_diff/self.t) if not self.precompute
+                              else val_diff < self.t * (self.__exps or self.__draw_exponentials()).pop()):
+            self.n_accepted += 1
+            self.s_cur = s_cand
+            self.val_cur = val_cand
             if self.val_best is None or val_cand < self.val_best:
-                self.s_best = deepcopy(s_cand)
-                self.val_best = deepcopy(val_cand)
-                if not self.stoping_val is None and self.stoping_val == self.val_best:
+                self.s_best = self.problem_obj.copy_solution(s_cand)
+                self.val_best = val_cand
+                self.__best_k, self.__best_t = self.iter - self.__iter_offset, self.t
+                if not self.stoping_val is None and self._target_reached(self.val_best):
+                    return True
+
+    def __annealing_move_step(self):
+        move = self.problem_obj.propose_move(self.s_cur)
+        if move is None:
+            return
+        val_diff = self.problem_obj.move_delta(self.s_cur, move)
+        if val_diff < 0 or (self.__random.random() < math.exp(-1*val_diff/self.t) if not self.precompute
+                              else val_diff < self.t * (self.__exps or self.__draw_exponentials()).pop()):
+            self.n_accepted += 1
+            if self.__best_pending:
+                self.__s_best = self.problem_obj.copy_solution(self.s_cur)
+                self.__best_pending = False
+            self.s_cur = self.problem_obj.apply_move(self.s_cur, move)
+            self.val_cur = self.val_cur + val_diff
+            if self.val_best is None or self.val_cur < self.val_best:
+                self.val_best = self.val_cur
+                self.__best_pending = True
+                self.__best_k, self.__best_t = self.iter - self.__iter_offset, self.t
+                if not self.stoping_val is None and self._target_reached(self.val_best):
                     return True
         
+    def _target_reached(self, val):
+        if self.tolerance is None:
+            return self.stoping_val == val
+        return val <= self.stoping_val + self.tolerance
+
+    def _stalled(self):
+        # called once per temperature update
+        if self.val_best is not None and self.val_best < self._stall_val - (self.tolerance or 0):
+            self._stall_val, self._stall_iter = self.val_best, self.iter
+        return self.iter - self._stall_iter >= self.stall_window
+
+    def _track_steps(self, accepted, proposed, improved):
+        # used by the subclasses with their own steps, to feed the adaptive schedule and reheating
+        self.n_accepted += accepted
+        self.n_evals += proposed
+        if improved:
+            self.__best_k, self.__best_t = self.iter - self.__iter_offset, self.t
+
+    def __draw_exponentials(self):
+        # u < exp(-diff/t)  <=>  diff < t * (-log(u)), and -log(u) of a uniform u is a standard
+        # exponential variate, so they are drawn in blocks and no exp() is needed per step
+        self.__exps = self.rng.standard_exponential(4096).tolist()
+        return self.__exps
+
+    def calibrate_initial_temp(self, sol, samples=100):
+        '''
+        Returns the temperature at which initial_acceptance of the uphill moves around sol would be
+        accepted, T0 = -mean(uphill deltas) / ln(initial_acceptance), using samples neighbours of sol
+        '''
+        if self.use_moves and hasattr(self.problem_obj, 'supports_moves') and self.problem_obj.supports_moves():
+            # a problem may have no move to propose (e.g. a solved Sudoku), those samples are skipped
+            moves = [self.problem_obj.propose_move(sol) for _ in range(samples)]
+            deltas = [self.problem_obj.move_delta(sol, move) for move in moves if move is not None]
+        else:
+            val = self.problem_obj.eval_solution(sol)
+            # some problems build the neighbour in place, so sol itself is not passed
+            deltas = [self.problem_obj.eval_solution(self.problem_obj.get_neighbour_solution(self.problem_obj.copy_solution(sol))) - val
+                      for _ in range(samples)]
+        uphill = [d for d in deltas if d is not None and d > 0]
+        if not uphill:
+            return 1000
+        return max(-1 * (sum(uphill) / len(uphill)) / math.log(self.initial_acceptance), 10 * self.final_temp)
+
+    def __lam_target(self):
+        # acceptance ratio targeted by the adaptive schedule (Lam and Delosme), it starts at 1,
+        # decays to 0.44 over the first 15% of the run, holds it and then decays towards 0
+        progress = self.iter / self.max_iter
+        if progress < 0.15:
+            return 0.44 + 0.56 * 560 ** (-1 * progress / 0.15)
+        elif progress < 0.65:
+            return 0.44
+        return 0.44 * 440 ** (-1 * (progress - 0.65) / 0.35)
+
+    def temperature_table(self):
+        '''
+        Returns the temperature of every iteration 0..max_iter of the (open loop) cooling schedule as a numpy array
+        '''
+        k = np.arange(self.max_iter + 1, dtype=float)
+        if self.__cooling_schedule == 'linear':
+            return self.initial_temp - (self.initial_temp - self.final_temp) * k / self.max_iter
+        elif self.__cooling_schedule == 'geometric':
+            return self.initial_temp * self.__cooling_alpha ** k
+        elif self.__cooling_schedule == 'logarithmic':
+            return self.initial_temp / (1 + self.__cooling_alpha * np.log(1 + k))
+        elif self.__cooling_schedule == 'exponential':
+            return self.initial_temp * np.exp(-1 * self.__cooling_alpha * k ** (1 / self.max_iter))
+        elif self.__cooling_schedule == 'linear_inverse':
+            return self.initial_temp / (1 + self.__cooling_alpha * k)
+        raise ValueError("Undefined cooling function " + self.__cooling_schedule)
+
     def update_temperature(self):
+        if self.n_evals > self.__level_evals:
+            self.acceptance_ratio = (self.n_accepted - self.__level_accepted) / (self.n_evals - self.__level_evals)
+        self.__level_evals, self.__level_accepted = self.n_evals, self.n_accepted
+
+        if self.reheat_after and self.iter - self.__iter_offset - self.__best_k >= self.reheat_after:
+            # the open loop schedules are moved back in time to where the best was found,
+            # max_iter still bounds the total number of iterations
+            self.__iter_offset = self.iter - self.__best_k
+            self.reheats += 1
+            if self.__cooling_schedule == 'adaptive':
+                self.t = self.__best_t
+                return
+        k = self.iter - self.__iter_offset
+
+        if not self.__temps is None:
+            try:
+                self.t = self.__temps[k]
+            except IndexError:
+                self.t = self.__temps[-1]
+            return
         if self.__cooling_schedule == 'linear':
-            self.t = self.initial_temp - (self.initial_temp - self.final_temp) * self.iter / self.max_iter
+            self.t = self.initial_temp - (self.initial_temp - self.final_temp) * k / self.max_iter
         elif self.__cooling_schedule == 'geometric':
-            self.t = self.initial_temp * self.__cooling_alpha ** self.iter
+            self.t = self.initial_temp * self.__cooling_alpha ** k
         elif self.__cooling_schedule == 'logarithmic':
-            self.t = self.initial_temp / (1 + self.__cooling_alpha * math.log(1 + self.iter))
+            self.t = self.initial_temp / (1 + self.__cooling_alpha * math.log(1 + k))
         elif self.__cooling_schedule == 'exponential':
-            self.t = self.initial_temp * math.exp(-1 * self.__cooling_alpha * self.iter ** (1 / self.max_iter))
+            self.t = self.initial_temp * math.exp(-1 * self.__cooling_alpha * k ** (1 / self.max_iter))
         elif self.__cooling_schedule == 'linear_inverse':
-            self.t = self.initial_temp / (1 + self.__cooling_alpha * self.iter)
+            self.t = self.initial_temp / (1 + self.__cooling_alpha * k)
+        elif self.__cooling_schedule == 'adaptive':
+            # cool when more moves than targeted are accepted, heat up otherwise
+            if self.acceptance_ratio is None or self.acceptance_ratio > self.__lam_target():
+                self.t = self.t * self.__cooling_alpha
+            else:
+                self.t = self.t / self.__cooling_alpha
         else:
             raise ValueError("Undefined cooling function " + self.__cooling_schedule)
 
     
-    def run(self, problem_obj=None, stoping_val=None, init=None, repetition=1):
+    def seed_rng(self, seed=None):
+        '''
+        Reseeds the random streams of the annealer and of its problem object with two streams
+        spawned from seed (an int or a numpy SeedSequence). With seed=None only the annealer gets
+        a new stream, drawn from np.random (see utilities.make_rngs)
+        '''
+        if seed is None:
+            self.rng, self.__random = make_rngs()
+            return
+        own, problem = spawn_seeds(seed, 2)
+        self.rng, self.__random = make_rngs(own)
+        if hasattr(self.problem_obj, 'seed_rng'):
+            self.problem_obj.seed_rng(problem)
+
+    def save_checkpoint(self, path):
+        '''
+        Saves the whole annealing state (and the state of the random streams) to path,
+        the problem object is not saved
+        '''
+        save_state(self, path, exclude=('problem_obj', 'observers'))
+
+    def resume(self, path, problem_obj=None):
+        '''
+        Loads a checkpoint saved by save_checkpoint (or by run with checkpoint_every) and continues
+        the run from there, the problem object has to be given unless this instance already has one
+        '''
+        if type(self).run is not SimulatedAnnealing.run:
+            raise NotImplementedError(type(self).__name__ + " runs can not be resumed")
+        if problem_obj:
+            self.problem_obj = problem_obj
+        load_state(self, path)
+        if not self.problem_obj:
+            raise RuntimeError("Problem object need to be set!")
+        self.budget.resume(self.n_evals)
+        self.__anneal()
+
+    def run(self, problem_obj=None, stoping_val=None, init=None, repetition=1, checkpoint_path=None, checkpoint_every=None):
+        '''
+        checkpoint_path and checkpoint_every save a checkpoint to checkpoint_path every checkpoint_every
+        temperature updates, the run can then be continued with resume(checkpoint_path, problem_obj)
+        '''
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every if checkpoint_path and checkpoint_every and checkpoint_every > 0 else None
+        self.n_evals, self.n_accepted, self.stop_reason = 0, 0, None
+        if problem_obj:
+            self.problem_obj = problem_obj
+        if not self.seed is None:
+            self.seed_rng(self.seed)
         self.init_annealing(problem_obj, stoping_val, init)
-        for __ in range(repetition):
-            while self.t > self.final_temp and self.iter <= self.max_iter:
+        self.__rep, self.__repetition = 0, repetition
+        self.budget.start(self.n_evals)
+        for observer in self.observers:
+            observer.on_start(self)
+        self.__anneal()
+
+    def __anneal(self):
+        while self.__rep < self.__repetition:
+            while self.t > self.final_temp and self.iter <= self.max_iter and self.stop_reason is None:
                 for _ in range(self.max_iter_per_temp):
                     if not self.annealing_step() is None:
+                        self.stop_reason = 'stoping_val'
                         if self.debug>0:
                             print(f"Optimal solution reatched!: \ncurr iter: {self.iter}, curr best value: {self.val_best}, curr temp:{self.t}, curr best: sol: {self.s_best}")
-
+                        for observer in self.observers:
+                            observer.on_iteration(self)
+                            observer.on_end(self)
                         return
+                    if self.n_evals >= self.budget.next_check:
+                        self.stop_reason = self.budget.exhausted(self.n_evals)
+                        if self.stop_reason:
+                            break
                     if self.debug>2:
                         print(f"curr iter: {self.iter}, curr int iter: {_}, curr value: {self.val_cur}, curr best value: {self.val_best}, curr temp:{self.t}, curr best: sol: {self.s_best}")
                 if self.debug>1:
                         print(f"curr iter: {self.iter}, curr value: {self.val_cur}, curr best value: {self.val_best}, curr temp:{self.t}, curr best: sol: {self.s_best}")
+                for observer in self.observers:
+                    observer.on_iteration(self)
                 self.update_temperature()
                 self.iter += 1
+                if self.stall_window and self.stop_reason is None and self._stalled():
+                    self.stop_reason = 'stall'
+                if self.checkpoint_every and self.iter % self.checkpoint_every == 0:
+                    self.save_checkpoint(self.checkpoint_path)
         
             if self.val_allbest is None or self.val_best < self.val_allbest:
-                self.s_allbest = deepcopy(self.s_best)
-                self.val_allbest = deepcopy(self.val_best)
-            if __  < repetition - 1:
+                self.s_allbest = self.problem_obj.copy_solution(self.s_best)
+                self.val_allbest = self.val_best
+            if self.__rep < self.__repetition - 1 and self.stop_reason is None:
                 if self.debug>0:
-                    print(f'Best solution at rep. {__+1} is:{self.val_best}')
+                    print(f'Best solution at rep. {self.__rep+1} is:{self.val_best}')
                 self.val_best = None
-                self.init_annealing(problem_obj, stoping_val, self.problem_obj.get_neighbour_solution(self.s_best))
+                self.init_annealing(None, self.stoping_val, self.problem_obj.get_neighbour_solution(self.s_best))
+            self.__rep += 1
+            if not self.stop_reason is None:
+                break
         
-        self.s_best = deepcopy(self.s_allbest)
-        self.val_best = deepcopy(self.val_allbest)
+        self.s_best = self.s_allbest
+        self.val_best = self.val_allbest
+        for observer in self.observers:
+            observer.on_end(self)
+        if self.debug>0:
+            print(f"Simulated Annealing is done ({self.stop_reason or 'schedule'}): \ncurr iter: {self.iter}, curr best value: {self.val_best}, curr temp:{self.t}, curr best: sol: {self.s_best}")
+
+
+def _run_chain(sa, problem_obj, stoping_val, init, repetition, seed, deadline=None, max_evaluations=None):
+    # Executed in the worker process, each chain gets its own SeedSequence for the annealer
+    # and the problem streams. deadline (a time() timestamp) and max_evaluations are what is
+    # left of the budget of the whole run for this chain
+    time_limit = None
+    if not deadline is None:
+        time_limit = deadline - time()
+        if time_limit <= 0:
+            return None, None, 0, 'time_limit'
+    sa.seed = seed
+    sa.budget = Budget(time_limit, max_evaluations)
+    SimulatedAnnealing.run(sa, problem_obj, stoping_val, init, repetition)
+    return sa.s_best, sa.val_best, sa.n_evals, sa.stop_reason
+
+
+class ParallelSimulatedAnnealing(SimulatedAnnealing):
+    '''
+    Multi-start simulated annealing, it runs n_chains independent SimulatedAnnealing chains
+    over a process pool and keeps the best solution among them. The rest of the params are
+    the same as SimulatedAnnealing.
+
+    n_chains                number of independent chains, defaults to n_jobs
+    n_jobs                  number of worker processes, defaults to os.cpu_count(),
+                            with n_jobs=1 the chains run one after the other in this process
+    seed                    seed used to derive one seed per chain, so a run can be repeated
+    time_limit, max_evaluations
+                            budget of the whole run, every chain gets the time left and its share
+                            of the evaluations left when it starts, no chain is started once the
+                            budget is used up and stop_reason tells why the run stopped
+
+    The problem object is sent to the workers, so it has to be picklable (e.g. the eval_func of
+    ContinuousFunctionBase must be a module level function, not a lambda).
+    '''
+    def __init__(self, n_chains=None, n_jobs=None, seed=None, **kargs) -> None:
+        super().__init__(seed=seed, **kargs)
+        self.n_jobs = n_jobs if n_jobs and n_jobs > 0 else os.cpu_count()
+        self.n_chains = n_chains if n_chains and n_chains > 0 else self.n_jobs
+        self.chains_val_best = None
+
+    def run(self, problem_obj=None, stoping_val=None, init=None, repetition=1):
+        if problem_obj:
+            self.problem_obj = problem_obj
+        else:
+            if not self.problem_obj:
+                raise RuntimeError("Problem object need to be set!")
+
+        seeds = spawn_seeds(self.seed, self.n_chains)
+        chain = copy(self)
+        chain.problem_obj = None
+        chain.observers = []
+        self.chains_val_best = [None] * self.n_chains
+        # time_limit and max_evaluations bound the whole run, not every chain
+        self.n_evals, self.stop_reason, self.stoping_val = 0, None, stoping_val
+        self.budget.start()
+        deadline = time() + self.budget.time_limit if self.budget.time_limit else None
+
+        results = {}
+        if self.n_jobs == 1:
+            for k in range(self.n_chains):
+                max_evaluations = self.__chain_evaluations(0, self.n_chains - k)
+                if self.stop_reason:
+                    break
+                result = _run_chain(chain, self.problem_obj, stoping_val, init, repetition, seeds[k],
+                                    deadline, max_evaluations)
+                if self.__collect(results, k, result, stoping_val):
+                    break
+        else:
+            n_workers = min(self.n_jobs, self.n_chains)
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                # the chains are submitted as workers free up, so the ones that are not needed
+                # anymore (budget used up or stoping_val reached) are never started
+                running, k = {}, 0
+                while True:
+                    while k < self.n_chains and len(running) < n_workers and not self.stop_reason:
+                        max_evaluations = self.__chain_evaluations(sum(n for _, n in running.values() if n),
+                                                                   self.n_chains - k)
+                        if self.stop_reason:
+                            break
+                        future = executor.submit(_run_chain, chain, self.problem_obj, stoping_val, init,
+                                                 repetition, seeds[k], deadline, max_evaluations)
+                        running[future] = (k, max_evaluations)
+                        k += 1
+                    if not running:
+                        break
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.__collect(results, running.pop(future)[0], future.result(), stoping_val)
+                    if self.stop_reason == 'stoping_val':
+                        break
+        if self.stop_reason is None:
+            self.stop_reason = self.budget.exhausted(self.n_evals)
+
+        self.s_best, self.val_best = None, None
+        for k, (s_best, val_best) in sorted(results.items()):
+            self.chains_val_best[k] = val_best
+            if self.val_best is None or val_best < self.val_best:
+                self.s_best, self.val_best = s_best, val_best
+        self.s_allbest, self.val_allbest = self.s_best, self.val_best
+        if self.debug>0:
+            print(f"Parallel Simulated Annealing is done ({self.stop_reason or 'schedule'}): \nchains run: {len(results)}, curr best value: {self.val_best}, curr best: sol: {self.s_best}")
+
+    def __chain_evaluations(self, reserved, n_left):
+        # share of the next chain of the evaluations that the finished chains did not use and the
+        # running ones did not reserve, None without max_evaluations
+        if not self.budget.max_evaluations:
+            return None
+        max_evaluations = (self.budget.max_evaluations - self.n_evals - reserved) // n_left
+        if max_evaluations <= 0:
+            self.stop_reason = 'max_evaluations'
+        return max_evaluations
+
+    def __collect(self, results, k, result, stoping_val):
+        # returns True when no more chains should be run
+        s_best, val_best, n_evals, stop_reason = result
+        self.n_evals += n_evals
+        if not val_best is None:
+            results[k] = (s_best, val_best)
+        if stop_reason == 'time_limit':
+            self.stop_reason = stop_reason
+        elif not stoping_val is None and not val_best is None and self._target_reached(val_best):
+            self.stop_reason = 'stoping_val'
+        return not self.stop_reason is None
+
+
+_replica_sa = None
+
+
+def _init_replica_worker(sa, problem_obj, stoping_val, init):
+    # Keeps one annealer with the problem object per worker process, so that only the
+    # replica states travel between the processes on every round. It is initialized once
+    # here, the rounds only set its state
+    global _replica_sa
+    _replica_sa = sa
+    _replica_sa.init_annealing(problem_obj, stoping_val, init)
+
+
+def _replica_sweep(s_cur, val_cur, t, n_steps, seed, sa=None):
+    if sa is None:
+        sa = _replica_sa
+    sa.seed_rng(int(seed))
+    sa.set_state(s_cur, val_cur, t)
+    n_evals, n_accepted = sa.n_evals, sa.n_accepted
+    for _ in range(n_steps):
+        if not sa.annealing_step() is None:
+            break
+    return sa.s_cur, sa.val_cur, sa.s_best, sa.val_best, sa.n_evals - n_evals, sa.n_accepted - n_accepted
+
+
+class ParallelTempering(SimulatedAnnealing):
+    '''
+    Replica exchange version of simulated annealing. Instead of cooling one chain, n_replicas
+    chains run at fixed temperatures spread geometrically between initial_temp and final_temp.
+    Every round each replica does max_iter_per_temp steps at its temperature (over a process
+    pool), then neighbouring replicas swap their states with probability
+    min(1, exp((1/T_i - 1/T_j) * (E_i - E_j))). The run stops after max_iter rounds or when
+    stoping_val is reached. The rest of the params are the same as SimulatedAnnealing, the
+    cooling schedule is not used.
+
+    n_replicas              number of temperatures in the ladder
+    n_jobs                  number of worker processes, defaults to min(n_replicas, os.cpu_count()),
+                            with n_jobs=1 the replicas run in this process
+    seed                    seed for the swaps and the replicas, so a run can be repeated
+
+    As in ParallelSimulatedAnnealing the problem object has to be picklable.
+    '''
+    def __init__(self, n_replicas=8, n_jobs=None, seed=None, **kargs) -> None:
+        super().__init__(seed=seed, **kargs)
+        self.n_replicas = n_replicas if n_replicas and n_replicas > 1 else 8
+        self.n_jobs = n_jobs if n_jobs and n_jobs > 0 else min(self.n_replicas, os.cpu_count())
+        self.temps = self.temperature_ladder()
+        self.replicas, self.replicas_val, self.swap_rate = [None] * 3
+
+    def temperature_ladder(self):
+        return [self.initial_temp * (self.final_temp / self.initial_temp) ** (k / (self.n_replicas - 1))
+                for k in range(self.n_replicas)]
+
+    def __exchange(self, rng, offset, swaps):
+        for k in range(offset, self.n_replicas - 1, 2):
+            delta = (1 / self.temps[k] - 1 / self.temps[k+1]) * (self.replicas_val[k] - self.replicas_val[k+1])
+            swaps[k][1] += 1
+            if delta >= 0 or rng.random() < math.exp(delta):
+                swaps[k][0] += 1
+                self.replicas[k], self.replicas[k+1] = self.replicas[k+1], self.replicas[k]
+                self.replicas_val[k], self.replicas_val[k+1] = self.replicas_val[k+1], self.replicas_val[k]
+
+    def run(self, problem_obj=None, stoping_val=None, init=None, repetition=1):
+        if problem_obj:
+            self.problem_obj = problem_obj
+        else:
+            if not self.problem_obj:
+                raise RuntimeError("Problem object need to be set!")
+
+        if not self.seed is None:
+            self.seed_rng(self.seed)
+        rng = self.rng
+        self.stoping_val = stoping_val
+        self.replicas = [self.problem_obj.copy_solution(init) if not init is None else self.problem_obj.get_init_solution()
+                         for _ in range(self.n_replicas)]
+        self.replicas_val = [self.problem_obj.eval_solution(s) for s in self.replicas]
+        if self.auto_initial_temp:
+            self.initial_temp = self.calibrate_initial_temp(self.replicas[0])
+            self.temps = self.temperature_ladder()
+        k_best = int(np.argmin(self.replicas_val))
+        self.s_best, self.val_best = self.problem_obj.copy_solution(self.replicas[k_best]), self.replicas_val[k_best]
+        swaps = [[0, 0] for _ in range(self.n_replicas - 1)]
+        # the observers see the coldest replica as the current solution
+        self.t, self.val_cur, self.n_evals, self.n_accepted = self.temps[-1], self.replicas_val[-1], 0, 0
+        self.stop_reason = None
+        self._stall_val, self._stall_iter = self.val_best, 0
+        self.budget.start(self.n_evals)
+        for observer in self.observers:
+            observer.on_start(self)
+
+        replica = copy(self)
+        replica.problem_obj = None
+        replica.observers = []
+        replica.debug = 0
+        replica.auto_initial_temp = False
+        executor = None
+        if self.n_jobs > 1:
+            executor = ProcessPoolExecutor(max_workers=self.n_jobs, initializer=_init_replica_worker,
+                                           initargs=(replica, self.problem_obj, stoping_val, self.replicas[0]))
+        else:
+            replica.init_annealing(self.problem_obj, stoping_val, self.replicas[0])
+
+        try:
+            for self.iter in range(1, self.max_iter + 1):
+                seeds = rng.integers(0, 2**32, size=self.n_replicas)
+                if executor:
+                    results = list(executor.map(_replica_sweep, self.replicas, self.replicas_val, self.temps,
+                                                [self.max_iter_per_temp] * self.n_replicas, seeds))
+                else:
+                    results = [_replica_sweep(self.replicas[k], self.replicas_val[k], self.temps[k],
+                                              self.max_iter_per_temp, seeds[k], replica) for k in range(self.n_replicas)]
+
+                for k, (s_cur, val_cur, s_best, val_best, n_evals, n_accepted) in enumerate(results):
+                    self.replicas[k], self.replicas_val[k] = s_cur, val_cur
+                    self.n_evals, self.n_accepted = self.n_evals + n_evals, self.n_accepted + n_accepted
+                    if not val_best is None and val_best < self.val_best:
+                        self.s_best, self.val_best = s_best, val_best
+                self.val_cur = self.replicas_val[-1]
+                for observer in self.observers:
+                    observer.on_iteration(self)
+
+                if self.debug>1:
+                    print(f"curr iter: {self.iter}, replicas values: {self.replicas_val}, curr best value: {self.val_best}")
+                if not stoping_val is None and self._target_reached(self.val_best):
+                    self.stop_reason = 'stoping_val'
+                    if self.debug>0:
+                        print(f"Optimal solution reatched!: \ncurr iter: {self.iter}, curr best value: {self.val_best}, curr best: sol: {self.s_best}")
+                    break
+                # a round of sweeps is the unit of work here, the budget is checked between rounds
+                if self.n_evals >= self.budget.next_check:
+                    self.stop_reason = self.budget.exhausted(self.n_evals)
+                    if self.stop_reason:
+                        break
+                if self.stall_window and self._stalled():
+                    self.stop_reason = 'stall'
+                    break
+
+                self.__exchange(rng, self.iter % 2, swaps)
+        finally:
+            if executor:
+                executor.shutdown()
+
+        self.swap_rate = [a / n if n else 0 for a, n in swaps]
+        self.s_allbest, self.val_allbest = self.s_best, self.val_best
+        for observer in self.observers:
+            observer.on_end(self)
+        if self.debug>0:
+            print(f"Parallel Tempering is done: \ncurr iter: {self.iter}, curr best value: {self.val_best}, swap rates: {self.swap_rate}, curr best: sol: {self.s_best}")
+
+
+class PopulationAnnealing(SimulatedAnnealing):
+    '''
+    Vectorised simulated annealing over a population of n_walkers solutions, all the walkers
+    follow the same cooling schedule and every step proposes, evaluates and accepts/rejects
+    the moves of the whole population with numpy operations. It needs a problem with the
+    population methods of ContinuousFunctionBase (get_init_population, get_neighbour_population
+    and eval_population), ideally with a vectorized eval_func. The rest of the params are the
+    same as SimulatedAnnealing.
+
+    n_walkers               number of solutions annealed together
+    boundary                how the steps that leave the bounds are handled, 'reflect' or 'clip'
+    resample                if True, the population is resampled with Boltzmann weights at every
+                            temperature change (population annealing), so the walkers concentrate
+                            on the low cost regions
+    '''
+    def __init__(self, n_walkers=1000, boundary='reflect', resample=False, **kargs) -> None:
+        super().__init__(**kargs)
+        self.n_walkers = n_walkers if n_walkers and n_walkers > 0 else 1000
+        self.boundary = boundary
+        self.resample = resample
+        self.population, self.population_val = [None] * 2
+
+    def init_annealing(self, problem_obj=None, stoping_val=None, init=None):
+        if problem_obj:
+            self.problem_obj = problem_obj
+        else:
+            if not self.problem_obj:
+                raise RuntimeError("Problem object need to be set!")
+        if not hasattr(self.problem_obj, 'eval_population'):
+            raise RuntimeError("PopulationAnnealing needs a problem with population methods, e.g. ContinuousFunctionBase")
+
+        self.stoping_val = stoping_val
+        self.iter = 1
+        if not init is None:
+            self.population = np.array(np.broadcast_to(init, (self.n_walkers, np.shape(init)[-1])), dtype=float)
+        else:
+            self.population = self.problem_obj.get_init_population(self.n_walkers)
+        self.population_val = self.problem_obj.eval_population(self.population)
+        if self.auto_initial_temp:
+            val_diff = self.problem_obj.eval_population(self.problem_obj.get_neighbour_population(self.population, self.boundary)) - self.population_val
+            uphill = val_diff[val_diff > 0]
+            self.initial_temp = max(-1 * uphill.mean() / math.log(self.initial_acceptance), 10 * self.final_temp) if uphill.size else 1000
+        self.t = self.initial_temp
+        k = int(np.argmin(self.population_val))
+        self.s_best, self.val_best = self.population[k].copy(), self.population_val[k]
+        self.s_cur, self.val_cur = self.s_best, self.val_best
+        self.s_allbest, self.val_allbest = [None] * 2
+        self._stall_val, self._stall_iter = self.val_best, self.iter
+        if self.debug>0:
+            print(f"Population annealing is initialized:\nbest value = {self.val_best}, current temp={self.t}")
+
+    def annealing_step(self):
+        if self.population is None:
+            raise RuntimeError("PopulationAnnealing population is not initialized, call init_annealing()")
+        cand = self.problem_obj.get_neighbour_population(self.population, self.boundary)
+        val_cand = self.problem_obj.eval_population(cand)
+        val_diff = val_cand - self.population_val
+        accept = self.rng.random(self.n_walkers) < np.exp(-1 * np.maximum(val_diff, 0) / self.t)
+        self.population[accept] = cand[accept]
+        self.population_val[accept] = val_cand[accept]
+
+        k = int(np.argmin(self.population_val))
+        self.s_cur, self.val_cur = self.population[k], self.population_val[k]
+        improved = self.val_cur < self.val_best
+        self._track_steps(int(np.count_nonzero(accept)), self.n_walkers, improved)
+        if improved:
+            self.s_best, self.val_best = self.s_cur.copy(), self.val_cur
+            if not self.stoping_val is None and self._target_reached(self.val_best):
+                return True
+
+    def __resample(self, prev_t):
+        weights = np.exp(-1 * (1 / self.t - 1 / prev_t) * (self.population_val - self.population_val.min()))
+        idx = self.rng.choice(self.n_walkers, self.n_walkers, p=weights / weights.sum())
+        self.population = self.population[idx]
+        self.population_val = self.population_val[idx]
+
+    def run(self, problem_obj=None, stoping_val=None, init=None, repetition=1):
+        self.n_evals, self.n_accepted, self.stop_reason = 0, 0, None
+        if problem_obj:
+            self.problem_obj = problem_obj
+        if not self.seed is None:
+            self.seed_rng(self.seed)
+        self.init_annealing(problem_obj, stoping_val, init)
+        self.budget.start(self.n_evals)
+        for observer in self.observers:
+            observer.on_start(self)
+        while self.t > self.final_temp and self.iter <= self.max_iter and self.stop_reason is None:
+            for _ in range(self.max_iter_per_temp):
+                if not self.annealing_step() is None:
+                    self.stop_reason = 'stoping_val'
+                    if self.debug>0:
+                        print(f"Optimal solution reatched!: \ncurr iter: {self.iter}, curr best value: {self.val_best}, curr temp:{self.t}, curr best: sol: {self.s_best}")
+                    for observer in self.observers:
+                        observer.on_iteration(self)
+                        observer.on_end(self)
+                    return
+                if self.n_evals >= self.budget.next_check:
+                    self.stop_reason = self.budget.exhausted(self.n_evals)
+                    if self.stop_reason:
+                        break
+            if self.debug>1:
+                print(f"curr iter: {self.iter}, curr pop. mean value: {self.population_val.mean()}, curr best value: {self.val_best}, curr temp:{self.t}, curr best: sol: {self.s_best}")
+            for observer in self.observers:
+                observer.on_iteration(self)
+            prev_t = self.t
+            self.update_temperature()
+            if self.resample:
+                self.__resample(prev_t)
+            self.iter += 1
+            if self.stall_window and self.stop_reason is None and self._stalled():
+                self.stop_reason = 'stall'
+
+        self.s_allbest, self.val_allbest = self.s_best, self.val_best
+        for observer in self.observers:
+            observer.on_end(self)
         if self.debug>0:
-            print(f"Simulated Annealing is done: \ncurr iter: {self.iter}, curr best value: {self.val_best}, curr temp:{self.t}, curr best: sol: {self.s_best}")
+            print(f"Population annealing is done: \ncurr iter: {self.iter}, curr best value: {self.val_best}, curr temp:{self.t}, curr best: sol: {self.s_best}")
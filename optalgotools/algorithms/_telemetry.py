@@ -0,0 +1,78 @@
+__all__ = ['Observer', 'TelemetryRecorder']
+
+from time import perf_counter
+import numpy as np
+
+
+class Observer:
+    '''
+    Base class for the observers passed to the metaheuristics (observers=[...]). The algorithm
+    calls on_start once the search is initialized, on_iteration after every temperature level
+    (SimulatedAnnealing) or iteration (TabuSearch) and on_end when the run is done. Each method
+    receives the algorithm object, so its attributes (iter, t, val_cur, val_best, n_evals, ...)
+    can be read.
+    '''
+    def on_start(self, algo):
+        pass
+
+    def on_iteration(self, algo):
+        pass
+
+    def on_end(self, algo):
+        pass
+
+
+class TelemetryRecorder(Observer):
+    '''
+    Records the progress of a run in fixed size numpy arrays used as a ring buffer, so the memory
+    stays flat whatever the length of the run and no printing or formatting is done.
+
+    capacity                number of records kept, the oldest are overwritten
+    every                   record only one iteration out of every
+
+    For each record: iteration, temperature (nan for tabu search), current value, best value,
+    acceptance rate and evaluations per second since the previous record. get() returns them in
+    chronological order as a dict of arrays.
+    '''
+    FIELDS = ('iteration', 'temperature', 'value', 'best_value', 'acceptance_rate', 'evals_per_sec')
+
+    def __init__(self, capacity=10000, every=1) -> None:
+        self.capacity = capacity if capacity and capacity > 0 else 10000
+        self.every = every if every and every > 0 else 1
+        self.iteration = np.zeros(self.capacity, dtype=np.int64)
+        self.temperature, self.value, self.best_value, self.acceptance_rate, self.evals_per_sec = \
+            [np.full(self.capacity, np.nan) for _ in range(5)]
+        self.reset()
+
+    def reset(self):
+        self.size, self.pos = 0, 0
+        self.__last_time, self.__last_evals, self.__last_accepted = perf_counter(), 0, 0
+
+    def on_start(self, algo):
+        self.__last_time = perf_counter()
+        self.__last_evals = getattr(algo, 'n_evals', 0)
+        self.__last_accepted = getattr(algo, 'n_accepted', 0)
+
+    def on_iteration(self, algo):
+        if algo.iter % self.every:
+            return
+        now = perf_counter()
+        n_evals = getattr(algo, 'n_evals', 0)
+        n_accepted = getattr(algo, 'n_accepted', None)
+        evals = n_evals - self.__last_evals
+
+        i = self.pos
+        self.iteration[i] = algo.iter
+        self.temperature[i] = np.nan if getattr(algo, 't', None) is None else algo.t
+        self.value[i] = np.nan if algo.val_cur is None else algo.val_cur
+        self.best_value[i] = np.nan if algo.val_best is None else algo.val_best
+        self.acceptance_rate[i] = (n_accepted - self.__last_accepted) / evals if evals and not n_accepted is None else np.nan
+        self.evals_per_sec[i] = evals / (now - self.__last_time) if now > self.__last_time else np.nan
+
+        self.pos = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.__last_time, self.__last_evals, self.__last_accepted = now, n_evals, n_accepted or 0
+
+    def get(self):
+        order = np.arange(self.pos - self.size, self.pos) % self.capacity
+        return {field: getattr(self, field)[order] for field in self.FIELDS}
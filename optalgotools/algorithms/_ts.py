@@ -1,52 +1,104 @@
 __all__ = ['TabuSearch']
 
+import os
 import math
-import random
-from copy import deepcopy
 import numpy as np
-import collections.abc
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from ._checkpoint import save_state, load_state
+from ._budget import Budget
+from ._memory import FrequencyMemory, PhaseScheduler
+from ..utilities import make_rngs, spawn_seeds
 
-class Hashing:
-    def __init__(self, v) -> None:
-        self.v = v
-
-    def __repr__(self) -> str:
-        return self.v.__repr__()
-
-    def __str__(self) -> str:
-        return self.v.__str__()
-    
-    def __getitem__(self, item):
-        return self.v[item]
-    
-    def __hash__(self) -> int:
-        if isinstance(self.v, collections.abc.Hashable):
-            return hash(self.v)
-        if type(self.v).__module__ == np.__name__:
-            return hash(tuple(self.v.flat))
-        if type(self.v) is set:
-            return hash(tuple(self.v))
-        if type(self.v) is dict:
-            return hash(tuple(sorted(self.v.keys())))
-        if type(self.v) is list:
-            return hash(tuple(np.array(self.v).flat))
-        raise RuntimeError('Unresolved hashing case!')
+NEIGHBOURHOODS = ['sample', 'full']
+EXECUTORS = ['thread', 'process']
 
 class TabuSearch:
 
     def __init__(self, max_iter=1000, tabu_tenure=1000, neighbor_size=10,
-                use_aspiration=True, aspiration_limit=None, use_longterm=False, 
-                 debug=0, **kargs) -> None:
+                use_aspiration=True, aspiration_limit=None, use_longterm=False, use_moves=True,
+                 neighbourhood='sample', eval_cache_size=None, n_jobs=1, executor='thread', batch_size=None, observers=None, time_limit=None, max_evaluations=None, tolerance=None,
+                 stall_window=None, longterm_size=None, longterm_decay=0.5, diversify_after=None, diversify_iters=None,
+                 diversify_weight=1.0, seed=None, debug=0, **kargs) -> None:
 
         self.debug = debug
+        # Observer objects (e.g. TelemetryRecorder) notified after every iteration
+        self.observers = list(observers) if observers else []
         self.max_iter = max_iter if max_iter and max_iter > 0 else 1000
         self.tabu_tenure = tabu_tenure if tabu_tenure and tabu_tenure > 0 else 1000
         self.neighbor_size = neighbor_size
         self.use_aspiration = use_aspiration
         self.aspiration_limit = aspiration_limit if aspiration_limit and aspiration_limit > 0 else tabu_tenure + 1
         self.use_longterm = use_longterm
+        # the long term memory of the moves taken has a fixed size: a count-min sketch with
+        # longterm_size counters per row (exact counts of the (i, j) moves in a full scan), whose
+        # counts are multiplied by longterm_decay every longterm_size moves. Without decay (None)
+        # the error bound of the sketch grows with the moves taken, so in a long search the
+        # moves taken less than total * e / longterm_size times all count as never taken
+        self.longterm_size = longterm_size if longterm_size and longterm_size > 0 else 4096
+        self.longterm_decay = longterm_decay
+        # after diversify_after iterations without improving the best, the search diversifies for
+        # diversify_iters iterations (tabu_tenure by default): every move is penalized by
+        # diversify_weight times its long term frequency. It then intensifies again from the best
+        self.scheduler = (PhaseScheduler(diversify_after, diversify_iters if diversify_iters and diversify_iters > 0
+                                         else self.tabu_tenure) if diversify_after and diversify_after > 0 else None)
+        self.diversify_weight = diversify_weight
+        # generate the neighbours through the problem's move protocol when it has one, they are
+        # then scored with move_delta and fingerprinted incrementally with move_fingerprint
+        self.use_moves = use_moves
+        # 'sample' looks at neighbor_size random neighbours per iteration, 'full' scores every move
+        # at once with the problem's neighbourhood_deltas and takes the best allowed one, the tabu
+        # keys are then the (i, j) indices of the moves
+        if neighbourhood not in NEIGHBOURHOODS:
+            raise ValueError("Undefined neighbourhood " + str(neighbourhood) + ", it must be one of " + str(NEIGHBOURHOODS))
+        self.neighbourhood = neighbourhood
+        # every candidate is evaluated once per step, eval_cache_size also keeps the values of the
+        # last eval_cache_size distinct solutions across iterations (by fingerprint) in a LRU cache
+        self.eval_cache_size = eval_cache_size if eval_cache_size and eval_cache_size > 0 else None
+        self.eval_cache = OrderedDict()
+        self.cache_hits, self.cache_misses = 0, 0
+        # with n_jobs > 1 the candidate solutions of a step are evaluated by a pool of n_jobs
+        # threads or processes (executor), batch_size solutions per task (by default one batch
+        # per worker). Only the evaluations run in the pool, the candidates are generated and
+        # the move is chosen in this process in the same order, so the search stays deterministic.
+        # Move deltas are cheap and are always computed here.
+        if executor not in EXECUTORS:
+            raise ValueError("Undefined executor " + str(executor) + ", it must be one of " + str(EXECUTORS))
+        self.n_jobs = n_jobs if n_jobs and n_jobs > 0 else os.cpu_count()
+        self.executor = executor
+        self.batch_size = batch_size if batch_size and batch_size > 0 else None
+        self.__pool = None
+        self.__prefetched = set()
         self.maximize = True if 'maximize' in kargs else False
         self.penalize = True if "penalize" in kargs else False
+        # run() stops with the best so far once time_limit seconds or max_evaluations are used,
+        # or after stall_window iterations without improving the best by more than tolerance;
+        # with a tolerance, stoping_val is reached within tolerance of it
+        self.budget = Budget(time_limit, max_evaluations)
+        self.tolerance = tolerance if tolerance and tolerance > 0 else None
+        self.stall_window = stall_window if stall_window and stall_window > 0 else None
+        self.stop_reason = None
+        self.n_evals = 0
+        self.problem_obj = None
+        self.__rep, self.__repetition = 0, 1
+        self.checkpoint_path, self.checkpoint_every = None, None
+        # with a seed every run() reseeds the search and the problem, so it can be repeated
+        self.seed = seed
+        self.seed_rng(seed)
+
+    def seed_rng(self, seed=None):
+        '''
+        Reseeds the random streams of the search and of its problem object with two streams
+        spawned from seed (an int or a numpy SeedSequence). With seed=None only the search gets
+        a new stream, drawn from np.random (see utilities.make_rngs)
+        '''
+        if seed is None:
+            self.rng, self.__random = make_rngs()
+            return
+        own, problem = spawn_seeds(seed, 2)
+        self.rng, self.__random = make_rngs(own)
+        if hasattr(self.problem_obj, 'seed_rng'):
+            self.problem_obj.seed_rng(problem)
 
     def init_ts(self, problem_obj=None, stoping_val=None, init=None):
         if problem_obj:
@@ -57,131 +109,415 @@ class TabuSearch:
 
         self.stoping_val = stoping_val
         self.iter = 1
+        # tabu_list maps a step to the iteration at which it stops being tabu, the steps are
+        # also queued in order of expiry so the expired ones are evicted without a full scan
         self.tabu_list = {}
+        self.__tabu_queue = deque()
+        self.__full = self.neighbourhood == 'full'
+        if self.__full and not (hasattr(self.problem_obj, 'supports_neighbourhood_deltas') and
+                                self.problem_obj.supports_neighbourhood_deltas()):
+            raise RuntimeError("neighbourhood='full' needs a problem that supports neighbourhood_deltas (e.g. TSP or SHEETS)")
+        self.__moves = (self.__full or self.use_moves and hasattr(self.problem_obj, 'supports_moves') and
+                        self.problem_obj.supports_moves())
         if not init is None:
-            self.s_cur = init
+            # moves are applied in place, so the caller's init must not be shared
+            self.s_cur = self.problem_obj.copy_solution(init) if self.__moves else init
         else:
-            self.s_cur = Hashing(self.problem_obj.get_init_solution())
-        self.val_cur = self.problem_obj.eval_solution(self.s_cur.v)
-        self.s_best, self.val_best = deepcopy(self.s_cur), deepcopy(self.val_cur)
+            self.s_cur = self.problem_obj.get_init_solution()
+        self.__fp_cur = self.problem_obj.fingerprint(self.s_cur) if self.__moves and not self.__full else None
+        self.val_cur = self.problem_obj.eval_solution(self.s_cur)
+        self.n_evals += 1
+        self.s_best, self.val_best = self.problem_obj.copy_solution(self.s_cur), self.val_cur
         self.iter_best = 0
+        self.__stall_val, self.__stall_iter = self.val_best, 0
         self.s_allbest, self.val_allbest = [None] * 2
         self.iter_all_best = 0
-        if self.use_longterm:
-            self.total_sol = 0
-            self.longterm = {}
+        # in a full scan the memory is made with the shape of the deltas on the first scan
+        self.longterm = (FrequencyMemory(self.longterm_size, shape=None, decay=self.longterm_decay)
+                         if (self.use_longterm or self.scheduler) and not self.__full else None)
+        if self.scheduler:
+            self.scheduler.start(self.iter)
         if self.debug>0:
             print(f"Tabu search is initialized:\ncurrent value = {self.val_cur}")
 
+    def _target_reached(self, val):
+        if self.tolerance is None:
+            return self.stoping_val == val
+        if self.maximize:
+            return val >= self.stoping_val - self.tolerance
+        return val <= self.stoping_val + self.tolerance
+
+    def __stalled(self):
+        tolerance = self.tolerance or 0
+        if (self.val_best > self.__stall_val + tolerance if self.maximize else self.val_best < self.__stall_val - tolerance):
+            self.__stall_val, self.__stall_iter = self.val_best, self.iter
+        return self.iter - self.__stall_iter >= self.stall_window
+
+    def is_tabu(self, step):
+        return self.tabu_list.get(step, 0) > self.iter
+
+    def tabu_tenure_left(self, step):
+        '''
+        Number of iterations step stays tabu, 0 if it is not tabu
+        '''
+        return max(self.tabu_list.get(step, 0) - self.iter, 0)
+
+    def __longterm_allows(self, key):
+        # the long term test, a move never taken always passes it. The sketch over-counts, so its
+        # estimates within the error bound count as never taken
+        return not self.longterm.seen(key) or self.__random.random() < self.longterm.frequency(key)
+
+    def __diversifying(self):
+        return self.scheduler is not None and self.scheduler.phase == 'diversify'
+
+    def __evict_expired(self):
+        while self.__tabu_queue and self.__tabu_queue[0][0] <= self.iter:
+            expiry, step = self.__tabu_queue.popleft()
+            # the step may have been made tabu again since, with a later expiry
+            if self.tabu_list.get(step) == expiry:
+                del self.tabu_list[step]
+
     def evaluate_with_penalty(self, value, step):
         if self.penalize and step:
             if value < 0:
-                if step in self.tabu_list:
-                    return max(value, self.tabu_list[step])
+                if self.is_tabu(step):
+                    return max(value, self.tabu_tenure_left(step))
                 return 0
-            if step not in self.tabu_list:
+            if not self.is_tabu(step):
                 return value
-            return (value - self.tabu_list[step])
+            return (value - self.tabu_tenure_left(step))
         return value
         
 
+    def __neighbours(self, s_cur):
+        # fingerprint -> (candidate, tabu key), a candidate is a move on s_cur in move mode and a
+        # neighbour solution otherwise. The tries are bounded as a small neighbourhood would
+        # otherwise make this spin on duplicates
+        cands = {}
+        for _ in range(10 * self.neighbor_size):
+            if len(cands) >= self.neighbor_size:
+                break
+            if self.__moves:
+                move = self.problem_obj.propose_move(s_cur)
+                if move is None:
+                    break
+                fp = self.problem_obj.move_fingerprint(s_cur, move, self.__fp_cur)
+                if not fp in cands:
+                    cands[fp] = (move, fp)
+            else:
+                solution, step = self.problem_obj.get_neighbour_solution(s_cur), None
+                if isinstance(solution, tuple):
+                    solution, step = solution
+                fp = self.problem_obj.fingerprint(solution)
+                if not fp in cands:
+                    # problems may build the neighbour in place, so a copy is kept
+                    cands[fp] = (self.problem_obj.copy_solution(solution), step if step else fp)
+        return cands
+
+    def __cached_eval(self, fp, cand, evaluate, step_cache):
+        if fp in step_cache:
+            # the first lookup of a prefetched value is not a saved evaluation
+            if fp in self.__prefetched:
+                self.__prefetched.discard(fp)
+            else:
+                self.cache_hits += 1
+            return step_cache[fp]
+        if self.eval_cache_size and fp in self.eval_cache:
+            self.cache_hits += 1
+            self.eval_cache.move_to_end(fp)
+            val = step_cache[fp] = self.eval_cache[fp]
+            return val
+        self.cache_misses += 1
+        self.n_evals += 1
+        val = step_cache[fp] = evaluate(cand)
+        if self.eval_cache_size:
+            self.eval_cache[fp] = val
+            if len(self.eval_cache) > self.eval_cache_size:
+                self.eval_cache.popitem(last=False)
+        return val
+
+    def __best_full_move(self, s_cur, val_cur):
+        deltas = np.array(self.problem_obj.neighbourhood_deltas(s_cur), dtype=float)
+        if (self.use_longterm or self.scheduler) and self.longterm is None:
+            self.longterm = FrequencyMemory(self.longterm_size, shape=deltas.shape, decay=self.longterm_decay)
+        valid = ~np.isnan(deltas)
+        self.n_evals += int(np.count_nonzero(valid))
+        scores = deltas.copy()
+        if self.penalize:
+            # as evaluate_with_penalty for the steps that are not tabu
+            scores[valid & (deltas < 0)] = 0
+        for key in list(self.tabu_list):
+            if not self.is_tabu(key) or not valid[key]:
+                continue
+            if (self.use_aspiration and val_cur + deltas[key] < self.val_cur and
+                self.aspiration_limit > self.tabu_tenure_left(key)):
+                scores[key] = self.evaluate_with_penalty(deltas[key], key)
+            else:
+                scores[key] = np.nan
+        if self.maximize:
+            scores = -scores
+        if self.__diversifying():
+            scores += self.diversify_weight * self.longterm.frequencies()
+        if np.all(np.isnan(scores)):
+            return None, None, None
+
+        if not self.use_longterm:
+            best = np.nanargmin(scores)
+        else:
+            # the best move that passes the long term frequency test, as in the sampled scan. The
+            # test is random, when it rejects every move the best move that is not tabu is taken,
+            # as a new scan could draw differently
+            best = None
+            for k in np.argsort(scores, axis=None):
+                if np.isnan(scores.flat[k]):
+                    break
+                key = tuple(int(x) for x in np.unravel_index(k, scores.shape))
+                if self.__longterm_allows(key):
+                    best = k
+                    break
+            if best is None:
+                best = np.nanargmin(scores)
+        i, j = (int(x) for x in np.unravel_index(best, scores.shape))
+        return self.problem_obj.neighbourhood_move(i, j), val_cur + deltas[i, j].item(), (i, j)
+
+    def __prefetch(self, cands, step_cache):
+        # evaluates in the pool the candidates the scan will need and that are not cached yet
+        fps, sols = [], []
+        for fp, (cand, key) in cands.items():
+            if fp in step_cache or not (not self.is_tabu(key) or
+                                        self.use_aspiration and self.aspiration_limit > self.tabu_tenure_left(key)):
+                continue
+            if self.eval_cache_size and fp in self.eval_cache:
+                self.cache_hits += 1
+                self.eval_cache.move_to_end(fp)
+                step_cache[fp] = self.eval_cache[fp]
+                self.__prefetched.add(fp)
+                continue
+            fps.append(fp)
+            sols.append(cand)
+        if not sols:
+            return
+        size = self.batch_size or -(-len(sols) // self.n_jobs)
+        batches = [sols[k : k + size] for k in range(0, len(sols), size)]
+        if self.executor == 'process':
+            results = self.__pool.map(_eval_batch, batches)
+        else:
+            results = self.__pool.map(lambda batch: [self.problem_obj.eval_solution(sol) for sol in batch], batches)
+        vals = [val for batch in results for val in batch]
+        self.cache_misses += len(vals)
+        self.n_evals += len(vals)
+        self.__prefetched.update(fps)
+        for fp, val in zip(fps, vals):
+            step_cache[fp] = val
+            if self.eval_cache_size:
+                self.eval_cache[fp] = val
+                if len(self.eval_cache) > self.eval_cache_size:
+                    self.eval_cache.popitem(last=False)
+
     def get_best_neighbour(self, s_cur, val_cur):
-        s_cands = set()
-        tmp_dict = {}
-        while len(s_cands) < self.neighbor_size:
-            solution, step = None, None
-            solution = self.problem_obj.get_neighbour_solution(s_cur.v)
-            if isinstance(solution, tuple):
-                step = solution[1]
-                solution = solution[0]
-            key = deepcopy(Hashing(solution))
-            s_cands.add(key)
-            tmp_dict[key] = step if step else key
-
-
-        s_cands = [k for k in s_cands if not tmp_dict[k] in self.tabu_list or
+        if self.__full:
+            return self.__best_full_move(s_cur, val_cur)
+        if self.__moves:
+            evaluate = lambda move: val_cur + self.problem_obj.move_delta(s_cur, move)
+        else:
+            evaluate = self.problem_obj.eval_solution
+        # candidate values of this step, by fingerprint
+        step_cache, self.__prefetched = {}, set()
+        cands = self.__neighbours(s_cur)
+        if self.__pool and not self.__moves:
+            self.__prefetch(cands, step_cache)
+
+        s_cands = [(fp, cand, key) for fp, (cand, key) in cands.items() if not self.is_tabu(key) or
                                                     (self.use_aspiration and 
-                                                     self.problem_obj.eval_solution(k.v)<self.val_cur and 
-                                                     self.aspiration_limit>self.tabu_list[tmp_dict[k]])]
+                                                     self.aspiration_limit>self.tabu_tenure_left(key) and
+                                                     self.__cached_eval(fp, cand, evaluate, step_cache)<self.val_cur)]
         
         if len(s_cands) == 0:
             return None, None, None
 
-        best_cand = None 
+        best_cand, best_key = None, None
         val_best_cand = -float("inf") if self.maximize else float("inf")
+        # diversification penalty of the best candidate, it is compared with the same penalty
+        diversifying, best_div = self.__diversifying(), 0
+        sign = -1 if self.maximize else 1
 
-        for s_cand in s_cands:
-            val_cand = self.problem_obj.eval_solution(s_cand.v)
-            penalized = self.evaluate_with_penalty(val_cand - val_cur, tmp_dict[s_cand])
-            comparison = (penalized > (val_best_cand - val_cur)) if self.maximize else (penalized < (val_best_cand - val_cur))  #(val_cand < val_best_cand)
-            if (not self.use_longterm or not tmp_dict[s_cand] in self.longterm or 
-                random.random() < self.longterm[tmp_dict[s_cand]] / self.total_sol) and comparison:  #:val_cand > val_best_cand
+        for fp, s_cand, key in s_cands:
+            val_cand = self.__cached_eval(fp, s_cand, evaluate, step_cache)
+            penalized = self.evaluate_with_penalty(val_cand - val_cur, key)
+            div = sign * self.diversify_weight * self.longterm.frequency(key) if diversifying else 0
+            comparison = ((penalized + div > (val_best_cand - val_cur) + best_div) if self.maximize else
+                          (penalized + div < (val_best_cand - val_cur) + best_div))  #(val_cand < val_best_cand)
+            # the long term test only draws for the candidates that would be taken
+            if comparison and (not self.use_longterm or self.__longterm_allows(key)):  #:val_cand > val_best_cand
                 val_best_cand = val_cand
-                best_cand = s_cand
+                best_cand, best_key, best_div = s_cand, key, div
 
-        return best_cand, val_best_cand, None if best_cand not in tmp_dict else tmp_dict[best_cand]
+        return best_cand, val_best_cand, best_key
 
 
     def ts_step(self):
         if not self.problem_obj:
             raise RuntimeError("Tabu search problem object is not initialized, call init_ts()")
 
+        self.__evict_expired()
         s_cand, val_cand, best_step = [None] *3
         i = 0
         while s_cand is None:
             s_cand, val_cand, best_step = self.get_best_neighbour(self.s_cur, self.val_cur)
             i += 1
-            if i > 1000:
+            # a full scan only finds nothing when every move is tabu, a new scan would not change that
+            if s_cand is None and (i > 1000 or self.__full):
                 if self.debug>0:
                     print(f"Optimal solution so far!: \ncurr iter: {self.iter}, curr best value: {self.val_best}, curr best: sol: {self.s_best}, found at iter: {self.iter_best}")
                 raise RuntimeError(f"Search space is too narrow (probably {len(self.tabu_list)}) which are all in the tabu list, try to increase the search space or set stopping value")
 
         
+        if self.__moves:
+            if not self.__full:
+                # in move mode the tabu key is the fingerprint of the solution the move leads to
+                self.__fp_cur = best_step
+            s_cand = self.problem_obj.apply_move(self.s_cur, s_cand)
+
         if (val_cand > self.val_best) == self.maximize and (val_cand != self.val_best):
-            self.s_best = deepcopy(s_cand)
-            self.val_best = deepcopy(val_cand)
+            self.s_best = self.problem_obj.copy_solution(s_cand)
+            self.val_best = val_cand
             self.iter_best = self.iter    
         
-        self.s_cur = deepcopy(s_cand)
-        self.val_cur = deepcopy(val_cand)
-
-        self.tabu_list = {k: v-1 for k,v in self.tabu_list.items() if v>1}
+        self.s_cur = s_cand
+        self.val_cur = val_cand
 
         if best_step:
-            if self.use_longterm:
-                self.total_sol += 1
-                if not best_step in self.longterm:
-                    self.longterm[best_step] = 0      
-                self.longterm[best_step] += 1
+            if self.longterm is not None:
+                self.longterm.add(best_step)
+
+            # tabu for the next tabu_tenure iterations
+            expiry = self.iter + self.tabu_tenure + 1
+            self.tabu_list[best_step] = expiry
+            self.__tabu_queue.append((expiry, best_step))
 
-            self.tabu_list[best_step] = self.tabu_tenure
+        if self.scheduler and self.scheduler.update(self.iter, self.iter_best):
+            if self.debug>1:
+                print(f"iter {self.iter}: {self.scheduler.phase} phase, best value = {self.val_best}")
+            if self.scheduler.phase == 'intensify':
+                # intensify around the best solution found
+                self.s_cur, self.val_cur = self.problem_obj.copy_solution(self.s_best), self.val_best
+                if self.__moves and not self.__full:
+                    self.__fp_cur = self.problem_obj.fingerprint(self.s_cur)
         # print(best_step)
     
-    def run(self, problem_obj=None, stoping_val=None, init=None, repetition=1):
+    def save_checkpoint(self, path):
+        '''
+        Saves the whole search state, tabu list and long term memory included (and the state of
+        the random streams) to path, the problem object is not saved
+        '''
+        save_state(self, path, exclude=('problem_obj', 'observers', '_TabuSearch__pool'))
+
+    def resume(self, path, problem_obj=None):
+        '''
+        Loads a checkpoint saved by save_checkpoint (or by run with checkpoint_every) and continues
+        the run from there, the problem object has to be given unless this instance already has one
+        '''
+        if problem_obj:
+            self.problem_obj = problem_obj
+        load_state(self, path)
+        if not self.problem_obj:
+            raise RuntimeError("Problem object need to be set!")
+        self.budget.resume(self.n_evals)
+        self.__search_in_pool(self.iter + 1)
+
+    def run(self, problem_obj=None, stoping_val=None, init=None, repetition=1, checkpoint_path=None, checkpoint_every=None):
+        '''
+        checkpoint_path and checkpoint_every save a checkpoint to checkpoint_path every checkpoint_every
+        iterations, the run can then be continued with resume(checkpoint_path, problem_obj)
+        '''
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every if checkpoint_path and checkpoint_every and checkpoint_every > 0 else None
+        self.n_evals, self.stop_reason = 0, None
+        self.cache_hits, self.cache_misses = 0, 0
+        self.eval_cache.clear()
+        if problem_obj:
+            self.problem_obj = problem_obj
+        if not self.seed is None:
+            self.seed_rng(self.seed)
         self.init_ts(problem_obj, stoping_val, init)
-        for __ in range(repetition):
-            for self.iter in range(1, self.max_iter+1):
+        self.__rep, self.__repetition = 0, repetition
+        self.budget.start(self.n_evals)
+        for observer in self.observers:
+            observer.on_start(self)
+        self.__search_in_pool(1)
+
+    def __search_in_pool(self, start_iter):
+        if self.n_jobs > 1:
+            if self.executor == 'process':
+                self.__pool = ProcessPoolExecutor(max_workers=self.n_jobs, initializer=_init_eval_worker,
+                                                  initargs=(self.problem_obj,))
+            else:
+                self.__pool = ThreadPoolExecutor(max_workers=self.n_jobs)
+        try:
+            self.__search(start_iter)
+        finally:
+            if self.__pool:
+                self.__pool.shutdown()
+                self.__pool = None
+
+    def __search(self, start_iter):
+        while self.__rep < self.__repetition:
+            for self.iter in range(start_iter, self.max_iter+1):
                 self.ts_step()        
+                if self.checkpoint_every and self.iter % self.checkpoint_every == 0:
+                    self.save_checkpoint(self.checkpoint_path)
+                for observer in self.observers:
+                    observer.on_iteration(self)
                 if self.debug>1:
                     print(f"curr iter: {self.iter}, curr value: {self.val_cur}, curr best value: {self.val_best}, curr best: sol: {self.s_best}, found at iter: {self.iter_best}")
 
-                if not self.stoping_val is None and self.stoping_val == self.val_best:
+                if not self.stoping_val is None and self._target_reached(self.val_best):
+                    self.stop_reason = 'stoping_val'
                     if self.debug>0:
                         print(f"Optimal solution reatched!: \ncurr iter: {self.iter}, curr best value: {self.val_best}, curr best: sol: {self.s_best}, found at iter: {self.iter_best}")
+                    for observer in self.observers:
+                        observer.on_end(self)
                     return
+                if self.n_evals >= self.budget.next_check:
+                    self.stop_reason = self.budget.exhausted(self.n_evals)
+                    if self.stop_reason:
+                        break
+                if self.stall_window and self.__stalled():
+                    self.stop_reason = 'stall'
+                    break
         
             if self.val_allbest is None or self.val_best < self.val_allbest:
-                self.s_allbest = deepcopy(self.s_best)
-                self.val_allbest = deepcopy(self.val_best)
+                self.s_allbest = self.problem_obj.copy_solution(self.s_best)
+                self.val_allbest = self.val_best
                 self.iter_all_best = self.iter_best
-            if __  < repetition - 1:
+            if self.__rep < self.__repetition - 1 and self.stop_reason is None:
                 if self.debug>0:
-                    print(f'Best solution at rep. {__+1} is:{self.val_best}')
+                    print(f'Best solution at rep. {self.__rep+1} is:{self.val_best}')
                 self.val_best = None
-                self.init_ts(problem_obj, stoping_val, self.s_best)
+                self.init_ts(None, self.stoping_val, self.s_best)
+            self.__rep += 1
+            start_iter = 1
+            if not self.stop_reason is None:
+                break
         
-        self.s_best = deepcopy(self.s_allbest)
-        self.val_best = deepcopy(self.val_allbest)
+        self.s_best = self.s_allbest
+        self.val_best = self.val_allbest
         self.iter_best = self.iter_all_best
+        for observer in self.observers:
+            observer.on_end(self)
         if self.debug>0:
-            print(f"Tabu search is done: \ncurr iter: {self.iter}, curr best value: {self.val_best}, curr best: sol: {self.s_best}, found at iter: {self.iter_best}")
+            print(f"Tabu search is done ({self.stop_reason or 'max_iter'}): \ncurr iter: {self.iter}, curr best value: {self.val_best}, curr best: sol: {self.s_best}, found at iter: {self.iter_best}")
+
+
+_eval_problem = None
+
+
+def _init_eval_worker(problem_obj):
+    # Keeps the problem object in every worker process, so that only the candidate
+    # solutions and their values travel between the processes
+    global _eval_problem
+    _eval_problem = problem_obj
+
+
+def _eval_batch(batch):
+    return [_eval_problem.eval_solution(sol) for sol in batch]
@@ -1,11 +1,12 @@
 import heapq
 import math
 from collections import deque
-from ..structures import Solution
+from ..structures import Solution, IndexedMinHeap, CSRGraph, CSRNode
+from ..utilities import haversine_array, straight_line_array
 from time import process_time
 from sys import getsizeof
-from copy import deepcopy
 import networkx as nx
+import numpy as np
 
 """
 Requirements:
@@ -79,70 +80,111 @@ The node class must have the following public object methods:
 - path(): generates a path from origin to this node by tracing node parents
 - expand(): generates a list of all the children (reachable nodes) from this node
 - get_id(): returns a unique identifier for the node
-- set_parent(node): sets the parent node of this node (this value will be used for the path method)
 - get_distance(): returns the edge distance between this node and its parent
-- set_distance(distance): sets the edge distance between this node and its parent
-
-
 """
 
 
-def Dijkstra(origin, destination, unrelaxed_nodes):
+def _csr_search(origin, destination, heuristic=None):
+    # Dijkstra, or A* with heuristic(indices) -> distances to the destination, on the arrays of
+    # the CSRGraph of the CSRNodes origin and destination. The nodes are their indices, expanding
+    # one reads a slice of targets and weights and makes no node object, the route is rebuilt
+    # from the parent indices. Returns the route (None if not found), the set of the settled
+    # indices and the peak size of the heap
+    graph = origin.graph
+    offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+    source, goal = origin.k, destination.k
+    entry_count = 1
+    frontier = [(heuristic([source])[0] if heuristic else 0, 0, source)]
+    g_score, parent = {source: 0}, {source: -1}
+    seen = set()
+    route, max_frontier = None, 0
+    while frontier:
+        _, _, k = heapq.heappop(frontier)
+        if k in seen:
+            continue
+        seen.add(k)
+        if k == goal:
+            route = graph.path(parent, k)
+            break
+        g, a, b = g_score[k], offsets[k], offsets[k + 1]
+        improved = []
+        for child, w in zip(targets[a:b].tolist(), weights[a:b].tolist()):
+            if child in seen:
+                continue
+            if g + w < g_score.get(child, math.inf):
+                g_score[child], parent[child] = g + w, k
+                improved.append(child)
+        # the heuristic is only computed for the nodes whose distance improved
+        for child, h in zip(improved, heuristic(improved) if heuristic and improved else [0] * len(improved)):
+            heapq.heappush(frontier, (g_score[child] + h, entry_count, child))
+            entry_count += 1
+        if getsizeof(frontier) > max_frontier:
+            max_frontier = getsizeof(frontier)
+    return route, seen, max_frontier
+
+
+def Dijkstra(origin, destination, unrelaxed_nodes=None):
+    # unrelaxed_nodes is no longer needed, the nodes are discovered through expand(), it is kept
+    # so the existing calls still work
     time_start = process_time()  # Time tracking
-    space = getsizeof(deepcopy(unrelaxed_nodes))  # Space tracking
+    if isinstance(origin, CSRNode):
+        route, seen, max_priority = _csr_search(origin, destination)
+        return Solution(route, process_time() - time_start, max_priority, len(seen))
+    max_priority = 0  # Space tracking
 
+    # The heap holds (distance, entry count, node) entries, a node whose distance decreases is
+    # pushed again and its stale entries are skipped when they are popped (lazy deletion)
+    entry_count = 1
+    priority_queue = [(0, 0, origin)]
+    shortest_dist = {origin.get_id(): 0}
     # Using a set here avoids the problem with self loops
     seen = set()  # explored tracking
-    shortest_dist = {node.get_id(): math.inf for node in unrelaxed_nodes}
-    shortest_dist[origin.get_id()] = 0
-    found = False
     route = None
-    while len(unrelaxed_nodes) > 0 and not found:
-        node = min(unrelaxed_nodes, key=lambda node: shortest_dist[node.get_id()])
+    while priority_queue:
+        node_cost, _, node = heapq.heappop(priority_queue)
+        if node.get_id() in seen:
+            continue
         # relaxing the node, so this node's value in shortest_dist is the shortest distance between the origin and destination
-        unrelaxed_nodes.remove(node)
         seen.add(node.get_id())
         # if the destination node has been relaxed then that is the route we want
         if node == destination:
             route = node.path()
-            found = True
-            continue
-        # otherwise, let's relax edges of its neighbours
+            break
+        # otherwise, let's relax edges of its neighbours, the children of expand() have node as
+        # parent so the path of the entry that is popped first is the shortest one
         for child in node.expand():
             # skip self-loops
             if child.get_id() in seen:
                 continue
-            child_obj = next(
-                (node for node in unrelaxed_nodes if node.get_id() == child.get_id()),
-                None,
-            )
-            child_obj.set_distance(child.get_distance())
-            distance = shortest_dist[node.get_id()] + child.get_distance()
-            if distance < shortest_dist[child_obj.get_id()]:
-                shortest_dist[child_obj.get_id()] = distance
-                child_obj.set_parent(node)
+            distance = node_cost + child.get_distance()
+            if distance < shortest_dist.get(child.get_id(), math.inf):
+                shortest_dist[child.get_id()] = distance
+                heapq.heappush(priority_queue, (distance, entry_count, child))
+                entry_count += 1
+                if getsizeof(priority_queue) > max_priority:
+                    max_priority = getsizeof(priority_queue)
     time_end = process_time()  # Time tracking
-    return Solution(route, time_end - time_start, space, len(seen))
+    return Solution(route, time_end - time_start, max_priority, len(seen))
 
 
-# This implementation uses a heap with tuples (a,b),
-# a is the cost of a node, and b is the node itself.
+# This implementation uses an indexed heap of the node ids with (a,b) priorities,
+# a is the cost of a node, and b is its entry count, the node itself is the item of its id.
 def UCS(origin, destination):
     time_start = process_time()  # Time tracking
     max_priority = 0  # Space tracking
 
     entry_count = 1
-    priority_queue = [(0, 0, origin)]
+    priority_queue = IndexedMinHeap()
+    priority_queue.push(origin.get_id(), (0, 0), origin)
 
     found = False
-    visited = []  # Explored tracking
+    route = []
+    visited = set()  # Explored tracking
     while priority_queue and not found:
-        node = heapq.heappop(priority_queue)
-        node_cost = node[0]
-        node = node[2]
-        if node in visited:
+        node_id, (node_cost, _), node = priority_queue.pop()
+        if node_id in visited:
             continue
-        visited.append(node)
+        visited.add(node_id)
         # We found the destination
         if node == destination:
             route = node.path()
@@ -150,119 +192,84 @@ def UCS(origin, destination):
             continue
         for child in node.expand():
             total_cost = child.get_distance() + node_cost
-            matches = [item for item in priority_queue if item[2] == child]
-            if matches:
+            if child.get_id() in priority_queue:
                 # Update the entry if the new priority is better
-                if total_cost < matches[0][0]:
-                    priority_queue[priority_queue.index(matches[0])] = (
-                        total_cost,
-                        entry_count,
-                        child,
-                    )
+                if total_cost < priority_queue.priority(child.get_id())[0]:
+                    priority_queue.push(child.get_id(), (total_cost, entry_count), child)
                     entry_count += 1
-                    heapq.heapify(priority_queue)
             else:
-                heapq.heappush(priority_queue, (total_cost, entry_count, child))
-                if getsizeof(priority_queue) > max_priority:
-                    max_priority = getsizeof(priority_queue)
+                priority_queue.push(child.get_id(), (total_cost, entry_count), child)
+                # the space of the heap itself, as when it was a plain list
+                if getsizeof(priority_queue.keys) > max_priority:
+                    max_priority = getsizeof(priority_queue.keys)
                 entry_count += 1
     time_end = process_time()  # Time tracking
     return Solution(route, time_end - time_start, max_priority, len(visited))
 
 
-def Bidirectional_Dijkstra(origin, destination, unrelaxed_nodes, expand_kwargs = {}):
+def Bidirectional_Dijkstra(origin, destination, unrelaxed_nodes=None, expand_kwargs = {}):
+    # unrelaxed_nodes is no longer needed, the nodes are discovered through expand(), it is kept
+    # so the existing calls still work
     time_start = process_time()  # Time tracking
-    frontier = deepcopy(unrelaxed_nodes)
-
-    space_required = getsizeof(frontier)
-
-    explored_f = set()
-    explored_b = set()
-
-    shortest_dist_f = {node.get_id(): math.inf for node in frontier}
-    shortest_dist_b = {node.get_id(): math.inf for node in frontier}
-
-    shortest_dist_f[origin] = 0
-    shortest_dist_b[destination] = 0
-
-    found = False
-    route = []
-
-    altr_expand = True  # to alternate between front and back
-
-    while frontier and not found:
-        if altr_expand:  # Forward
-            node = min(frontier, key=lambda node: shortest_dist_f[node.get_id()])
-            # relaxing the node, so this node's value in shortest_dist is the shortest distance between the origin and destination
-            frontier.remove(node)
-            explored_f.add(node)
-            # if the destination node has been relaxed then that is the route we want
-            if node == destination:
-                route = node.path()
-                found = True
-                continue
-
-            # otherwise, let's relax edges of its neighbours
-            for child in node.expand(**expand_kwargs):
-                # skip self-loops
-                if child.get_id() in explored_f:
-                    continue
-
-                # Check the child is collided
-                if child in explored_b:
-                    overlapped = next((node for node in explored_b if node == child))
-                    # we don't take the overlapped node twice
-                    route = child.path()[:-1] + overlapped.path()[::-1]
-                    found = True
-                    break
+    space_required = 0  # Space tracking
+
+    # one heap, distance map, parent map and set of settled nodes per direction, the parent
+    # map of the backward search points towards the destination
+    frontier = {True: [(0, 0, origin)], False: [(0, 0, destination)]}
+    shortest_dist = {True: {origin.get_id(): 0}, False: {destination.get_id(): 0}}
+    parent = {True: {origin.get_id(): None}, False: {destination.get_id(): None}}
+    explored = {True: set(), False: set()}
+    entry_count = 1
 
-                child_obj = next(
-                    (node for node in frontier if node.get_id() == child.get_id()), None
-                )
-                child_obj.set_distance(child.get_distance())
-                distance = shortest_dist_f[node.get_id()] + child.get_distance()
-                if distance < shortest_dist_f[child_obj.get_id()]:
-                    shortest_dist_f[child_obj.get_id()] = distance
-                    child_obj.set_parent(node)
-            altr_expand = False
-        if not altr_expand:  # Backward
-            node = min(frontier, key=lambda node: shortest_dist_b[node.get_id()])
-            # relaxing the node, so this node's value in shortest_dist is the shortest distance between the origin and destination
-            frontier.remove(node)
-            explored_b.add(node)
-            # if the destination node has been relaxed then that is the route we want
-            if node == origin:
-                route = node.path()[::-1]
-                found = True
+    # best_mu is the length of the shortest origin-destination path seen so far, through meet
+    best_mu, meet = (0, origin.get_id()) if origin == destination else (math.inf, None)
+
+    while frontier[True] and frontier[False]:
+        # drop the entries of the nodes already settled
+        for forward in (True, False):
+            while frontier[forward] and frontier[forward][0][2].get_id() in explored[forward]:
+                heapq.heappop(frontier[forward])
+        if not frontier[True] or not frontier[False]:
+            break
+        # no path through an unsettled node can be shorter than best_mu any more
+        if frontier[True][0][0] + frontier[False][0][0] >= best_mu:
+            break
+        # expand the direction with the closest node
+        forward = frontier[True][0][0] <= frontier[False][0][0]
+        node_cost, _, node = heapq.heappop(frontier[forward])
+        explored[forward].add(node.get_id())
+        dist, other_dist = shortest_dist[forward], shortest_dist[not forward]
+        for child in node.expand(reverse=not forward, **expand_kwargs):
+            # skip self-loops
+            if child.get_id() in explored[forward]:
                 continue
+            distance = node_cost + child.get_distance()
+            if distance < dist.get(child.get_id(), math.inf):
+                dist[child.get_id()] = distance
+                parent[forward][child.get_id()] = node.get_id()
+                heapq.heappush(frontier[forward], (distance, entry_count, child))
+                entry_count += 1
+                # the child is reached from both sides
+                if child.get_id() in other_dist and distance + other_dist[child.get_id()] < best_mu:
+                    best_mu, meet = distance + other_dist[child.get_id()], child.get_id()
+        if getsizeof(frontier[True]) + getsizeof(frontier[False]) > space_required:
+            space_required = getsizeof(frontier[True]) + getsizeof(frontier[False])
 
-            # otherwise, let's relax edges of its neighbours
-            for child in node.expand(reverse=True, **expand_kwargs):
-                # skip self-loops
-                if child.get_id() in explored_b:
-                    continue
-
-                # Check the child is collided
-                if child in explored_f:
-                    overlapped = next(
-                        (node for node in explored_f if node == child), None
-                    )
-                    route = overlapped.path()[:-1] + child.path()[::-1]
-                    found = True
-                    break
-
-                child_obj = next(
-                    (node for node in frontier if node.get_id() == child.get_id()), None
-                )
-                child_obj.set_distance(child.get_distance())
-                distance = shortest_dist_b[node.get_id()] + child.get_distance()
-                if distance < shortest_dist_b[child_obj.get_id()]:
-                    shortest_dist_b[child_obj.get_id()] = distance
-                    child_obj.set_parent(node)
-            altr_expand = True
+    route = []
+    if meet is not None:
+        # origin -> meet with the forward parents, then meet -> destination with the backward ones
+        node = meet
+        while node is not None:
+            route.append(node)
+            node = parent[True][node]
+        route.reverse()
+        node = parent[False][meet]
+        while node is not None:
+            route.append(node)
+            node = parent[False][node]
     time_end = process_time()  # Time tracking
     return Solution(
-        route, time_end - time_start, space_required, len(explored_f) + len(explored_b)
+        route, time_end - time_start, space_required, len(explored[True]) + len(explored[False])
     )
 
 
@@ -287,38 +294,130 @@ def Kruskal(G, attr="weight", sorted_edges=False, edges=None, graph_type=nx.Grap
     return mst
 
 
+class StraightLineHeuristic:
+    '''
+    Straight-line distance from the nodes of G to the destination, from their 'x' and 'y'
+    coordinates. A node's distance is computed the first time it is asked for and memoised, the
+    nodes asked for together (e.g. the children of an expansion) are measured in one numpy call.
+    G can be a networkx graph or its CSRGraph, whose coordinates are read from its arrays.
+    metric                  'haversine' for longitudes and latitudes, the distances are then in
+                            meters as the 'length' of the osmnx edges, or 'euclidean' for
+                            projected coordinates. By default 'haversine' if the crs of the graph
+                            is epsg:4326 (unprojected osmnx graphs), 'euclidean' otherwise
+    scale                   factor applied to the distances, e.g. to turn them into the unit of
+                            the edge weights. The heuristic must not overestimate the remaining
+                            cost for A* to find the shortest route
+    '''
+    def __init__(self, G, destination, metric=None, scale=1):
+        if metric is None:
+            metric = 'haversine' if str(G.graph.get('crs', '')).lower() == 'epsg:4326' else 'euclidean'
+        if metric not in ('haversine', 'euclidean'):
+            raise ValueError("Undefined metric " + str(metric) + ", it must be 'haversine' or 'euclidean'")
+        self.G = G
+        self.metric = metric
+        self.scale = scale
+        if isinstance(G, CSRGraph):
+            k = G.index[destination]
+            self.x, self.y = G.x[k], G.y[k]
+        else:
+            self.x, self.y = G.nodes[destination]['x'], G.nodes[destination]['y']
+        self.memo = dict()
+        # memo of at(), by index of the CSRGraph
+        self.memo_index = dict()
+
+    def __call__(self, node):
+        return self.many([node])[0]
+
+    def __distances(self, x, y):
+        if self.metric == 'haversine':
+            dist = haversine_array(x, y, self.x, self.y, r=6371000)
+        else:
+            dist = straight_line_array(x, y, self.x, self.y)
+        return (dist * self.scale).tolist()
+
+    def many(self, nodes):
+        new = [node for node in nodes if node not in self.memo]
+        if new:
+            if isinstance(self.G, CSRGraph):
+                k = [self.G.index[node] for node in new]
+                x, y = self.G.x[k], self.G.y[k]
+            else:
+                x = np.array([self.G.nodes[node]['x'] for node in new], dtype=float)
+                y = np.array([self.G.nodes[node]['y'] for node in new], dtype=float)
+            self.memo.update(zip(new, self.__distances(x, y)))
+        return [self.memo[node] for node in nodes]
+
+    def at(self, ks):
+        '''
+        Distances of the nodes of index ks of the CSRGraph G
+        '''
+        new = [k for k in ks if k not in self.memo_index]
+        if new:
+            self.memo_index.update(zip(new, self.__distances(self.G.x[new], self.G.y[new])))
+        return [self.memo_index[k] for k in ks]
+
+
 """
 Requirements:
 The node class must have the following public object methods:
 - path(): generates a path from origin to this node by tracing node parents
 - expand(): generates a list of all the children (reachable nodes) from this node
+- get_id(): returns a unique identifier for the node
+- get_distance(): returns the edge distance between this node and its parent
+
+The CSRNode of a CSRGraph (structures) meets these requirements for all the searches of this
+module, e.g. A_Star(csr, csr.node(origin_id), csr.node(destination_id)). Dijkstra and A_Star
+search the arrays of the CSRGraph of CSRNodes directly, without making a node per child.
+
+heuristic_fn(G, origin, destination, **heuristic_kwargs) returns the straight-line distances of the
+nodes from the origin and to the destination (see routing.astar_heuristic), the second one is the
+heuristic. Without heuristic_fn a StraightLineHeuristic(G, destination, **heuristic_kwargs) is used.
 """
 
 
 def A_Star(
-    G, origin, destination, heuristic_fn, heuristic_kwargs={}, expand_kwargs={}
+    G, origin, destination, heuristic_fn=None, heuristic_kwargs={}, expand_kwargs={}
 ):
     start_time = process_time()
-    toDestination, toOrigin = heuristic_fn(G, origin, destination, **heuristic_kwargs)
-
+    if heuristic_fn is None:
+        straight_line = StraightLineHeuristic(G, destination.get_id(), **heuristic_kwargs)
+        heuristic = straight_line.many
+    else:
+        _, toDestination = heuristic_fn(G, origin, destination, **heuristic_kwargs)
+        heuristic = lambda nodes: [toDestination[node] for node in nodes]
+
+    if isinstance(origin, CSRNode):
+        graph = origin.graph
+        if heuristic_fn is None and G is graph:
+            by_index = straight_line.at
+        else:
+            by_index = lambda ks: heuristic([graph.ids[k] for k in ks])
+        route, explored, _ = _csr_search(origin, destination, by_index)
+        return Solution(route or [], process_time() - start_time, getsizeof(explored), len(explored))
+
+    # The heap holds (g + h, entry count, node) entries, g is the shortest known distance from
+    # the origin, the entries of closed nodes are skipped when they are popped
     route = []
-    frontier = list()
-    frontier.append(origin)
+    entry_count = 1
+    frontier = [(heuristic([origin.get_id()])[0], 0, origin)]
+    g_score = {origin.get_id(): 0}
     explored = set()
-    found = False
-    while frontier and not found:
-        # choose a node based on its heuristic value
-        node = min(frontier, key=lambda node: toOrigin[node.get_id()] + toDestination[node.get_id()])
-        frontier.remove(node)
-        explored.add(node)
-        # expand its children
-        for child in node.expand(**expand_kwargs):
-            if child not in explored and child not in frontier:
-                if child == destination:
-                    route = child.path()
-                    found = True
-                    continue
-                frontier.append(child)
+    while frontier:
+        _, _, node = heapq.heappop(frontier)
+        if node.get_id() in explored:
+            continue
+        if node == destination:
+            route = node.path()
+            break
+        explored.add(node.get_id())
+        # expand its children, the heuristic is only computed for the nodes that are reached
+        children = [child for child in node.expand(**expand_kwargs) if child.get_id() not in explored]
+        for child, h in zip(children, heuristic([child.get_id() for child in children])):
+            g = g_score[node.get_id()] + child.get_distance()
+            if g < g_score.get(child.get_id(), math.inf):
+                g_score[child.get_id()] = g
+                heapq.heappush(frontier, (g + h, entry_count, child))
+                entry_count += 1
     space = getsizeof(explored)
     end_time = process_time()
     return Solution(route, end_time-start_time, space, len(explored))
@@ -0,0 +1,47 @@
+'''
+Micro-benchmark of the per-step overhead of SimulatedAnnealing, with and without the
+precomputed temperature table / block drawn acceptance randoms (precompute=True).
+
+The problem always proposes an uphill move of +1 with an O(1) neighbour and evaluation, so
+every step goes through the Metropolis test and the measured time is mostly the annealer's
+own bookkeeping. The best of the repeats is reported.
+
+usage: python bench_sa_step.py [steps] [repeat]
+'''
+import sys
+import timeit
+from optalgotools.algorithms import SimulatedAnnealing
+from optalgotools.problems import ProblemBase
+
+
+class Uphill(ProblemBase):
+    def get_init_solution(self):
+        return 0
+
+    def get_neighbour_solution(self, sol):
+        return sol + 1
+
+    def eval_solution(self, sol):
+        return sol
+
+
+def time_per_call(func, steps, repeat):
+    return min(timeit.repeat(func, number=steps, repeat=repeat)) / steps
+
+
+def bench(precompute, steps, repeat):
+    sa = SimulatedAnnealing(max_iter=1000, max_iter_per_temp=1, initial_temp=100, final_temp=0.1,
+                            cooling_schedule='linear_inverse', precompute=precompute)
+    sa.init_annealing(Uphill())
+    sa.iter = 500
+    sa.update_temperature()
+    return time_per_call(sa.annealing_step, steps, repeat), time_per_call(sa.update_temperature, steps, repeat)
+
+
+if __name__ == '__main__':
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 7
+    print(f"{'':12s} {'annealing_step':>15s} {'update_temperature':>19s}")
+    for precompute in (False, True):
+        step, temp = bench(precompute, steps, repeat)
+        print(f"{'precomputed' if precompute else 'on the fly':12s} {step * 1e9:12.1f} ns {temp * 1e9:16.1f} ns")
@@ -1,5 +1,5 @@
 from .__problem_base import ProblemBase, ContinuousFunctionBase
 from .tsp import TSP
-from .sudoku import Sudoku
+from .sudoku import Sudoku, solve_sudoku, solve_sudoku_file
 from .sheets import SHEETS
 from .albp import ALBP
\ No newline at end of file
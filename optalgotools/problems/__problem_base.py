@@ -1,9 +1,22 @@
 import abc
+from copy import deepcopy
+from hashlib import blake2b
 import numpy as np
 import matplotlib.pyplot as plt
+from ..utilities import make_rngs
 
 
 class ProblemBase(metaclass=abc.ABCMeta):
+    def __init__(self, seed=None) -> None:
+        self.seed_rng(seed)
+
+    # Every random draw of a problem comes from its own streams, rng (a numpy Generator) and
+    # random (a random.Random seeded from rng, for the scalar draws). The algorithms reseed them
+    # with a stream spawned from their own seed, seed can be None, an int, a numpy SeedSequence
+    # or a Generator (see utilities.make_rngs).
+    def seed_rng(self, seed=None):
+        self.rng, self.random = make_rngs(seed)
+
     @abc.abstractmethod
     def get_init_solution(self):
         pass
@@ -16,27 +29,212 @@ class ProblemBase(metaclass=abc.ABCMeta):
     def eval_solution(self, sol):
         pass
 
+    # Used by the algorithms whenever they need to keep a solution aside (e.g. the best one).
+    # The default is a shallow copy for lists and numpy arrays, problems whose solutions hold
+    # mutable items (e.g. a list of lists) should override it.
+    def copy_solution(self, sol):
+        if isinstance(sol, (list, np.ndarray)):
+            return sol.copy()
+        return deepcopy(sol)
 
-class ContinuousFunctionBase(ProblemBase):
+    # Optional move protocol, a problem that implements it lets the algorithms
+    # score a neighbour by the change it makes instead of a full eval_solution.
+    # propose_move(sol)         returns a move object (or None if no move is possible)
+    # move_delta(sol, move)     returns eval_solution(after move) - eval_solution(sol)
+    # apply_move(sol, move)     applies the move in place and returns the solution
+    def supports_moves(self):
+        return False
+
+    def propose_move(self, sol):
+        raise NotImplementedError
+
+    def move_delta(self, sol, move):
+        raise NotImplementedError
+
+    def apply_move(self, sol, move):
+        raise NotImplementedError
+
+    # Integer fingerprints, used e.g. by TabuSearch as tabu and duplicate keys.
+    # fingerprint(sol)                      returns an int that identifies sol
+    # move_fingerprint(sol, move, fp)       returns the fingerprint of sol after move (sol is not
+    #                                       changed) given fp = fingerprint(sol), problems with
+    #                                       Zobrist fingerprints update fp in O(1) per move
+    def fingerprint(self, sol):
+        if isinstance(sol, np.ndarray):
+            return int.from_bytes(blake2b(sol.tobytes(), digest_size=8).digest(), 'little')
+        if isinstance(sol, (list, tuple)):
+            try:
+                return hash(tuple(sol))
+            except TypeError:
+                # items that are not hashable, e.g. a list of lists
+                pass
+        return hash(_hashable(sol))
+
+    def move_fingerprint(self, sol, move, fp):
+        return self.fingerprint(self.apply_move(self.copy_solution(sol), move))
+
+    # Optional full neighbourhood, for problems whose moves are indexed by a pair (i, j), e.g. all
+    # the swaps or 2-opt reversals of a permutation, so that every move is scored in one pass.
+    # neighbourhood_deltas(sol)     returns a numpy matrix D, D[i, j] is the change of eval_solution
+    #                               made by neighbourhood_move(i, j), nan if (i, j) is not a move
+    # neighbourhood_move(i, j)      returns the move of D[i, j], it is applied with apply_move
+    def supports_neighbourhood_deltas(self):
+        return False
+
+    def neighbourhood_deltas(self, sol):
+        raise NotImplementedError
+
+    def neighbourhood_move(self, i, j):
+        raise NotImplementedError
+
+
+def _hashable(v):
+    # nested lists and tuples become nested tuples, sets and dicts frozensets so that their
+    # fingerprint does not depend on their iteration order
+    if isinstance(v, (list, tuple)):
+        return tuple(_hashable(x) for x in v)
+    if isinstance(v, (set, frozenset)):
+        return frozenset(_hashable(x) for x in v)
+    if isinstance(v, dict):
+        return frozenset((k, _hashable(x)) for k, x in v.items())
+    if isinstance(v, np.ndarray):
+        return (v.shape, tuple(v.flat))
+    return v
+
+
+# Zobrist tables with more keys than this are kept as numpy arrays (8 bytes per key instead of
+# about 40 for a list of Python ints), the smaller ones as lists, which are faster to index
+ZOBRIST_LIST_MAX = 2**18
 
-    def __init__(self, eval_func, bounds, step=1) -> None:
-        super().__init__()
+
+def zobrist_table(n_positions, n_values, seed=0):
+    '''
+    Random 63 bit keys, one per (position, value), table[position][value]. The Zobrist fingerprint
+    of a solution is the xor of the keys of its (position, value) pairs, so changing the value at a
+    position is two xors. The seed is fixed so fingerprints are the same across processes (e.g.
+    checkpoints). The table is a list of lists up to ZOBRIST_LIST_MAX keys, an int64 numpy array
+    above, with the same keys.
+    '''
+    table = np.random.default_rng(seed).integers(0, 2**63, size=(n_positions, n_values), dtype=np.int64)
+    return table.tolist() if table.size <= ZOBRIST_LIST_MAX else table
+
+
+def swap_deltas(dists, path, weights):
+    '''
+    Cost changes of swapping the items at positions i < j of path, for a path that costs
+    sum(weights[k] * dists[path[k], path[k+1]]). Only the inner positions 1..len(path)-2 are
+    swapped, the returned len(path) x len(path) matrix is nan elsewhere and for i >= j.
+    '''
+    m = len(path)
+    k = np.arange(1, m - 1)
+    prev, cur, nxt = path[k - 1], path[k], path[k + 1]
+    w_prev, w_next = weights[k - 1], weights[k]
+    before = w_prev * dists[prev, cur] + w_next * dists[cur, nxt]
+    # after[i, j] is the cost of the two edges around position i once it holds cur[j]
+    after = (w_prev[:, None] * dists[prev[:, None], cur[None, :]] +
+             w_next[:, None] * dists[cur[None, :], nxt[:, None]])
+    inner = after + after.T - before[:, None] - before[None, :]
+    # adjacent positions share an edge, which is reversed instead
+    a, b = cur[:-1], cur[1:]
+    adj = np.arange(m - 3)
+    inner[adj, adj + 1] = (w_prev[:-1] * (dists[prev[:-1], b] - dists[prev[:-1], a]) +
+                           w_next[:-1] * (dists[b, a] - dists[a, b]) +
+                           w_next[1:] * (dists[a, nxt[1:]] - dists[b, nxt[1:]]))
+    inner[np.tril_indices(m - 2)] = np.nan
+    deltas = np.full((m, m), np.nan)
+    deltas[1:m - 1, 1:m - 1] = inner
+    return deltas
+
+
+def reverse_deltas(dists, path, weights):
+    '''
+    Cost changes of reversing the segment i..j (i < j) of path (2-opt), same conventions as
+    swap_deltas. The edges inside the segment are only counted for asymmetric dists.
+    '''
+    m = len(path)
+    k = np.arange(1, m - 1)
+    prev, cur, nxt = path[k - 1], path[k], path[k + 1]
+    w_prev, w_next = weights[k - 1], weights[k]
+    inner = (w_prev[:, None] * dists[prev[:, None], cur[None, :]] +
+             w_next[None, :] * dists[cur[:, None], nxt[None, :]] -
+             (w_prev * dists[prev, cur])[:, None] - (w_next * dists[cur, nxt])[None, :])
+    # cumulative change of the inner edges when they are walked backward
+    rev = np.concatenate(([0], np.cumsum(weights * (dists[path[1:], path[:-1]] - dists[path[:-1], path[1:]]))))
+    inner += rev[k][None, :] - rev[k][:, None]
+    inner[np.tril_indices(m - 2)] = np.nan
+    deltas = np.full((m, m), np.nan)
+    deltas[1:m - 1, 1:m - 1] = inner
+    return deltas
+
+
+def zobrist_hash(table, seq):
+    # xor of the keys of the values of seq at positions 0..len(seq)-1
+    if isinstance(table, np.ndarray):
+        if len(seq) == 0:
+            return 0
+        return int(np.bitwise_xor.reduce(table[np.arange(len(seq)), seq]))
+    fp = 0
+    for keys, v in zip(table, seq):
+        fp ^= keys[v]
+    return fp
+
+
+class ContinuousFunctionBase(ProblemBase):
+    '''
+    eval_func               the function to minimize, it is called as eval_func(x1, x2, ...)
+    bounds                  numpy array of [min, max] per dimension
+    step                    the std of the gaussian step used to generate a neighbour, scalar
+                            or one per dimension
+    vectorized              True if eval_func accepts numpy arrays for x1, x2, ... and returns
+                            one value per element (e.g. it is written with numpy operations),
+                            then eval_population evaluates a whole population in a single call
+    seed                    seed of the problem's random streams (see ProblemBase.seed_rng)
+    '''
+    def __init__(self, eval_func, bounds, step=1, vectorized=False, seed=None) -> None:
+        super().__init__(seed)
         self.__eval_func = eval_func
         self.__bounds = bounds        
         self.__step = step
+        self.vectorized = vectorized
 
     def get_init_solution(self):
-        return self.__bounds[:, 0] + np.random.rand(len(self.__bounds)) * (self.__bounds[:, 1] - self.__bounds[:, 0])
+        return self.__bounds[:, 0] + self.rng.random(len(self.__bounds)) * (self.__bounds[:, 1] - self.__bounds[:, 0])
 
     def get_neighbour_solution(self, sol):
         new_sol = self.__bounds[:, 0] - 1
         while (new_sol < self.__bounds[:, 0]).any() or (new_sol > self.__bounds[:, 1]).any():
-            new_sol = sol + np.random.randn(len(self.__bounds)) * self.__step
+            new_sol = sol + self.rng.standard_normal(len(self.__bounds)) * self.__step
         return new_sol
 
     def eval_solution(self, sol):
         return self.__eval_func(*sol)
 
+    # Population versions of the methods above, a population is an (n, d) array with one
+    # solution per row
+
+    def get_init_population(self, n):
+        return self.__bounds[:, 0] + self.rng.random((n, len(self.__bounds))) * (self.__bounds[:, 1] - self.__bounds[:, 0])
+
+    def get_neighbour_population(self, pop, boundary='reflect'):
+        '''
+        One gaussian step for every solution, the steps that leave the bounds are either
+        reflected back at the bound ('reflect') or stopped at it ('clip')
+        '''
+        low, high = self.__bounds[:, 0], self.__bounds[:, 1]
+        new_pop = pop + self.rng.standard_normal(pop.shape) * self.__step
+        if boundary == 'clip':
+            return np.clip(new_pop, low, high)
+        elif boundary == 'reflect':
+            width = high - low
+            new_pop = np.mod(new_pop - low, 2 * width)
+            return low + np.where(new_pop > width, 2 * width - new_pop, new_pop)
+        raise ValueError("Undefined boundary method " + boundary + ", it must be 'reflect' or 'clip'")
+
+    def eval_population(self, pop):
+        if self.vectorized:
+            return np.broadcast_to(np.asarray(self.__eval_func(*pop.T), dtype=float), pop.shape[:1]).copy()
+        return np.array([self.__eval_func(*sol) for sol in pop], dtype=float)
+
     def plot(self, best_sol=None, titl=None, figsize=(12, 10), fontsize=12, save_file=None):
         plt.figure(figsize=figsize)
         if titl:
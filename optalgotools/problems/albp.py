@@ -1,15 +1,14 @@
 from .__problem_base import ProblemBase
 import numpy as np
 import pandas as pd 
-import random as rd
 import math
 import matplotlib.pyplot as plt
 import requests
 import io
 
 class ALBP(ProblemBase):
-    def __init__(self, url, problem, Cycle_time) -> None:
-        super().__init__()
+    def __init__(self, url, problem, Cycle_time, seed=None) -> None:
+        super().__init__(seed)
         self.url = url
         self.problem = problem
         self.Cycle_time = Cycle_time
@@ -32,8 +31,8 @@ class ALBP(ProblemBase):
         for i in range(len(sol)):
             Sol_list[i] = 'T' + str(Sol_list[i]+1)
         for i in range(len(sol)): 
-            x = rd.randint(0, s-1)
-            y = rd.randint(0, s-1)
+            x = self.random.randint(0, s-1)
+            y = self.random.randint(0, s-1)
             t1 = Sol_list[x]
             t2 = Sol_list[y]
             Sol_list[x] = t2
@@ -257,8 +256,8 @@ class ALBP(ProblemBase):
         i1 = 0
         i2 = 0
         while i1==i2: 
-            i1 = rd.randint(0, len(sol)-1)
-            i2 = rd.randint(0, len(sol)-1)
+            i1 = self.random.randint(0, len(sol)-1)
+            i2 = self.random.randint(0, len(sol)-1)
         sol_n = sol[:]
         t1 = sol[i1]
         t2 = sol[i2]
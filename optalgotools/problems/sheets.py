@@ -1,7 +1,7 @@
-from .__problem_base import ProblemBase
+from .__problem_base import ProblemBase, swap_deltas
 import urllib.request  # the lib that handles the url stuff
-import random
 import math
+import numpy as np
 import matplotlib.pyplot as plt
 
 class SHEETS(ProblemBase):
@@ -13,9 +13,10 @@ class SHEETS(ProblemBase):
                                             by selecting the pairwise shortest distances 
                                             between citis. This will not leed to the shortest
                                             path but it much better than the random
+    seed                    seed of the problem's random streams (see ProblemBase.seed_rng)
     '''
-    def __init__(self, **kargs) -> None:
-        super().__init__()
+    def __init__(self, seed=None, **kargs) -> None:
+        super().__init__(seed)
         
         self.cities = range(7)
         self.letter_mapping = {0:'a', 1:'b', 2:'c', 3:'d', 4:'e', 5:'f', 6:'g'}
@@ -30,6 +31,11 @@ class SHEETS(ProblemBase):
         }
 
         self.n = 7
+        # dists as a matrix padded with a node n at distance 0 of all, it stands for the two
+        # free ends of the stack in neighbourhood_deltas
+        self.__dists_array = np.zeros((self.n + 1, self.n + 1))
+        for (i, j), d in self.dists.items():
+            self.__dists_array[i, j] = d
                     
         if not 'init_method' in kargs:
             self.init_method = 'random'
@@ -40,7 +46,7 @@ class SHEETS(ProblemBase):
 
     def get_init_solution(self):
         if self.init_method == 'random':
-            return random.sample(range(self.n), self.n)
+            return self.random.sample(range(self.n), self.n)
         
         elif self.init_method == 'greedy':
             max_dist = -float("inf")
@@ -79,16 +85,32 @@ class SHEETS(ProblemBase):
 
 
     def get_neighbour_solution(self, sol):
-        c1 = random.randrange(self.n)
+        c1 = self.random.randrange(self.n)
         c2 = c1
         while c2 == c1:
-            c2 = random.randrange(self.n)
+            c2 = self.random.randrange(self.n)
         sol[c1], sol[c2] = sol[c2], sol[c1]
         
         swap = (sol[c1], sol[c2]) if sol[c1] < sol[c2] else (sol[c2], sol[c1])
         return sol, swap
         
 
+    def supports_neighbourhood_deltas(self):
+        return True
+
+    def neighbourhood_deltas(self, sol):
+        # every swap of two positions
+        path = np.array([self.n] + list(sol) + [self.n])
+        return swap_deltas(self.__dists_array, path, np.ones(self.n + 1))[1:self.n + 1, 1:self.n + 1]
+
+    def neighbourhood_move(self, i, j):
+        return (i, j)
+
+    def apply_move(self, sol, move):
+        i, j = move
+        sol[i], sol[j] = sol[j], sol[i]
+        return sol
+
     def eval_solution(self, sol):
         strength = 0
         for i in range(self.n - 1):
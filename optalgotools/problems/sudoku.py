@@ -1,13 +1,36 @@
-from .__problem_base import ProblemBase
+from .__problem_base import ProblemBase, zobrist_table, zobrist_hash
+from concurrent.futures import ProcessPoolExecutor
+import math
 import numpy as np
-import random
+
+# digits of the text format of solve_sudoku_file, '0' or '.' is an empty cell
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
 
 
 class Sudoku(ProblemBase):
-    def __init__(self, fixed_vals: dict, gen_method=None, loop=True, **gen_method_kargs) -> None:
-        super().__init__()
+    '''
+    fixed_vals              the n x n puzzle, 0 for the empty cells, n is the square of the box
+                            size (9, 16, 25...). The boards are uint8 arrays
+    gen_method              'mutate' changes num_mut (1 by default) conflicting cells per neighbour
+    seed                    seed of the problem's random streams (see ProblemBase.seed_rng)
+
+    The board being searched (the last one given by get_init_solution or passed to the move and
+    neighbour methods) is tracked: the problem keeps the count of every digit in every row, column
+    and box of it, and the number of conflicts of each cell, and updates them on each change made
+    through its own methods. The cost, move deltas and conflicting cells of that board are then
+    read from the counters. A tracked board changed from outside has to be given to track() again.
+    '''
+    def __init__(self, fixed_vals: dict, gen_method=None, loop=True, seed=None, **gen_method_kargs) -> None:
+        super().__init__(seed)
         self.fixed_vals = fixed_vals
+        self.__n = len(fixed_vals)
+        self.__box = math.isqrt(self.__n)
+        if self.__box < 2 or self.__box**2 != self.__n or np.shape(fixed_vals) != (self.__n, self.__n):
+            raise ValueError("A sudoku must be n x n with n the square of the box size, got shape " + str(np.shape(fixed_vals)))
+        self.__init_units()
         self.reset()
+        # Zobrist keys for fingerprint(), one per (cell, digit)
+        self.__zobrist = zobrist_table(self.__n**2, self.__n + 1)
         if gen_method is None:
             gen_method = 'mutate'
         self.gen_method = gen_method
@@ -17,17 +40,117 @@ class Sudoku(ProblemBase):
             else:
                 self.num_mut = gen_method_kargs['num_mut']
 
+    def __init_units(self):
+        # units 0..n-1 are the rows, n..2n-1 the columns and 2n..3n-1 the boxes, the cells are
+        # numbered row by row
+        self.__cell_units, self.__unit_cells = _unit_layout(self.__n)
+        self.__board = None
+
+    @property
+    def size(self):
+        return self.__n
+
+    def units(self, sol):
+        '''
+        The rows, then the columns, then the boxes of sol as the rows of a (3n, n) array, built
+        from reshaped views of the board
+        '''
+        n, b = self.__n, self.__box
+        sol = np.asarray(sol)
+        boxes = sol.reshape(b, b, b, b).swapaxes(1, 2).reshape(n, n)
+        return np.concatenate((sol, sol.T, boxes))
+
+    def track(self, sol):
+        '''
+        Counts the digits of sol from scratch and makes it the tracked board
+        '''
+        n = self.__n
+        self.__board = sol
+        self.__vals = np.ravel(sol).tolist()
+        self.__free = [v == 0 for v in np.ravel(self.fixed_sol).tolist()]
+        self.__counts = [[0] * (n + 1) for _ in range(3*n)]
+        for c, v in enumerate(self.__vals):
+            for u in self.__cell_units[c]:
+                self.__counts[u][v] += 1
+        # number of digits (0 included) present more than once in each unit
+        self.__dups = [sum(k > 1 for k in counts) for counts in self.__counts]
+        self.__n_bad = sum(d > 0 for d in self.__dups)
+        self.__conf = [sum(self.__counts[u][v] - 1 for u in self.__cell_units[c]) for c, v in enumerate(self.__vals)]
+        # free cells with conflicts, with their positions for O(1) removal and random choice
+        self.__conflicting, self.__conflict_pos = [], {}
+        for c in range(n*n):
+            self.__refresh(c)
+
+    def __tracked(self, sol):
+        if sol is not self.__board:
+            self.track(sol)
+
+    def __refresh(self, c):
+        if self.__free[c] and self.__conf[c] > 0:
+            if not c in self.__conflict_pos:
+                self.__conflict_pos[c] = len(self.__conflicting)
+                self.__conflicting.append(c)
+        elif c in self.__conflict_pos:
+            k, last = self.__conflict_pos.pop(c), self.__conflicting.pop()
+            if last != c:
+                self.__conflicting[k] = last
+                self.__conflict_pos[last] = k
+
+    def __set(self, sol, i, j, val):
+        # writes val at (i, j) of the tracked board sol and updates the counters
+        c = i * self.__n + j
+        old = self.__vals[c]
+        sol[i, j] = val
+        if old == val:
+            return
+        vals, conf = self.__vals, self.__conf
+        for u in self.__cell_units[c]:
+            for k in self.__unit_cells[u]:
+                if k != c and (vals[k] == old or vals[k] == val):
+                    conf[k] += 1 if vals[k] == val else -1
+                    self.__refresh(k)
+            counts = self.__counts[u]
+            counts[old] -= 1
+            if counts[old] == 1:
+                self.__dups[u] -= 1
+                self.__n_bad -= self.__dups[u] == 0
+            counts[val] += 1
+            if counts[val] == 2:
+                self.__dups[u] += 1
+                self.__n_bad += self.__dups[u] == 1
+        vals[c] = val
+        conf[c] = sum(self.__counts[u][val] - 1 for u in self.__cell_units[c])
+        self.__refresh(c)
+
+    def __fix(self, i, j, val):
+        self.fixed_sol[i][j] = val
+        self.__fixed_cands.clear()
+        if self.__board is not None:
+            c = i * self.__n + j
+            self.__free[c] = False
+            self.__refresh(c)
+
     def __get_cand__(self, i, j, sol=None):
         if sol is None:
-            sol = self.fixed_sol
-        cand = set(range(1, 10))
-        cand -= set(sol[i, :])
-        cand -= set(sol[:, j])
-        cand -= set(sol[int(i/3)*3: int(i/3)*3+3, int(j/3)*3: int(j/3)*3+3].flat)
+            # the candidates given the fixed cells only change when a cell is fixed
+            if not (i, j) in self.__fixed_cands:
+                self.__fixed_cands[(i, j)] = self.__get_cand__(i, j, self.fixed_sol)
+            return set(self.__fixed_cands[(i, j)])
+        elif sol is self.__board:
+            counts = self.__counts
+            r, col, b = self.__cell_units[i * self.__n + j]
+            return {d for d in range(1, self.__n + 1) if not (counts[r][d] or counts[col][d] or counts[b][d])}
+        b_i, b_j = i // self.__box * self.__box, j // self.__box * self.__box
+        cand = set(range(1, self.__n + 1))
+        cand -= set(sol[i, :].tolist())
+        cand -= set(sol[:, j].tolist())
+        cand -= set(sol[b_i: b_i + self.__box, b_j: b_j + self.__box].ravel().tolist())
         return cand
 
     def reset(self):
-        self.fixed_sol = np.array(self.fixed_vals, dtype=int)
+        self.fixed_sol = np.array(self.fixed_vals, dtype=np.uint8)
+        self.__fixed_cands = {}
+        self.__board = None
         
     def get_init_solution(self):
         sol = np.copy(self.fixed_sol)
@@ -37,39 +160,34 @@ class Sudoku(ProblemBase):
             (i, j) = found
             cand = self.__get_cand__(i, j)
             if len(cand) == 1:
-                sol[i][j] = self.fixed_sol[i][j] = list(cand)[0]
+                self.__fix(i, j, list(cand)[0])
+                sol[i][j] = self.fixed_sol[i][j]
             else:
-                sol[i][j] = np.random.choice(list(cand))
+                sol[i][j] = self.random.choice(list(cand))
             found = self.find_empty(sol)
 
+        self.track(sol)
         return sol
     
     def count_contradicting_cells(self, i, j, sol=None):
         if sol is None:
             sol = self.fixed_sol
+        elif sol is self.__board:
+            return self.__conf[i * self.__n + j]
         val = sol[i][j]
+        b_i, b_j = i // self.__box * self.__box, j // self.__box * self.__box
         cont = 0
         cont += np.count_nonzero(sol[i, :]==val)-1
         cont += np.count_nonzero(sol[:, j]==val)-1
-        cont += np.count_nonzero(sol[int(i/3)*3: int(i/3)*3+3, int(j/3)*3: int(j/3)*3+3]==val)-1
+        cont += np.count_nonzero(sol[b_i: b_i + self.__box, b_j: b_j + self.__box]==val)-1
         return cont
 
-    def find_contradicting_cell(self, sol):
-        if self.eval_solution(sol)==0:
+    def find_contradicting_cell(self, sol, check_solved=True):
+        # a random free cell among the ones with conflicts
+        self.__tracked(sol)
+        if not self.__conflicting:
             return False
-        cands_cells = []
-        for i in range(9):
-            for j in range(9):
-                if self.fixed_sol[i][j]==0:
-                    cands_cells.append((i, j))
-        random.shuffle(cands_cells)
-        for cell in cands_cells:
-            i, j = cell
-            cont = self.count_contradicting_cells(i, j, sol)
-            if cont == 0:
-                continue
-            return cell
-        return False
+        return divmod(self.__conflicting[self.random.randrange(len(self.__conflicting))], self.__n)
 
 
     def get_neighbour_solution(self, sol):
@@ -87,39 +205,109 @@ class Sudoku(ProblemBase):
                 val = sol[i][j]
                 
                 if len(cand_fixed) == 1:
-                    sol[i][j] = self.fixed_sol[i][j] = list(cand_fixed)[0]
+                    self.__fix(i, j, list(cand_fixed)[0])
+                    self.__set(sol, i, j, self.fixed_sol[i][j])
                 else:
                     if len(cand)==0:
                         cand = cand_fixed
                     if len(cand)>1:
                         cand -= {val}
-                    sol[i][j] = np.random.choice(list(cand))
+                    self.__set(sol, i, j, self.random.choice(list(cand)))
+
+        return sol
+
+    def supports_moves(self):
+        return self.gen_method == 'mutate' and self.num_mut == 1
 
+    def propose_move(self, sol):
+        # Same mutation as get_neighbour_solution, but returned as (i, j, new value)
+        # instead of being written to sol, the problem is not changed
+        found = self.find_contradicting_cell(sol, check_solved=False)
+        if not found:
+            return None
+        i, j = found
+        cand = self.__get_cand__(i, j, sol)
+        cand_fixed = self.__get_cand__(i, j)
+        if len(cand_fixed) == 0:
+            raise RuntimeError(f'Problem unsolvable, pos ({i} , {j}) is contradicting with every fixed sol.')
+
+        if len(cand_fixed) == 1:
+            # the cell is fixed by apply_move, only if the move is taken
+            return (i, j, list(cand_fixed)[0])
+        if len(cand)==0:
+            cand = cand_fixed
+        if len(cand)>1:
+            cand -= {sol[i][j]}
+        return (i, j, self.random.choice(list(cand)))
+
+    def move_delta(self, sol, move):
+        # Only the row, column and box of the changed cell can change the cost
+        i, j, val = move
+        self.__tracked(sol)
+        c = i * self.__n + j
+        old = self.__vals[c]
+        if old == val:
+            return 0
+        delta = 0
+        for u in self.__cell_units[c]:
+            counts, dups = self.__counts[u], self.__dups[u]
+            after = dups - (counts[old] == 2) + (counts[val] == 1)
+            delta += (after > 0) - (dups > 0)
+        return delta
+
+    def apply_move(self, sol, move):
+        i, j, val = move
+        self.__tracked(sol)
+        # a free cell given its only candidate left by the fixed cells becomes fixed
+        if self.__free[i * self.__n + j] and self.__get_cand__(i, j) == {val}:
+            self.__fix(i, j, val)
+        self.__set(sol, i, j, val)
         return sol
 
+    def fingerprint(self, sol):
+        return zobrist_hash(self.__zobrist, np.ravel(sol))
+
+    def move_fingerprint(self, sol, move, fp):
+        i, j, val = move
+        c = i * self.__n + j
+        return fp ^ int(self.__zobrist[c][sol[i][j]] ^ self.__zobrist[c][val])
+
     def eval_solution(self, sol):
-        cost = 0
-        for i in range(9):
-            cost += (9 - np.unique(sol[:, i]).shape[0]) > 0
-            cost += (9 - np.unique(sol[i, :]).shape[0]) > 0
-            cost += (9 - np.unique(sol[i%3*3: i%3*3+3, int(i/3)*3: int(i/3)*3+3]).shape[0]) > 0
-        return cost
+        # number of rows, columns and boxes with a repeated digit (or more than one empty cell)
+        if sol is self.__board:
+            return self.__n_bad
+        units = np.sort(self.units(sol), axis=1)
+        return int(np.count_nonzero((units[:, 1:] == units[:, :-1]).any(axis=1)))
 
     def find_empty(self, sol):
-        for i in range(9):
-            for j in range(9):
-                if sol[i][j] == 0:
-                    return (i, j)
+        # first empty cell, row by row
+        k = np.flatnonzero(np.ravel(sol) == 0)
+        if k.size == 0:
+            return False
+        return divmod(int(k[0]), self.__n)
 
-        return False
+    def solve_exact(self):
+        '''
+        Same as solve_backtrack (fills fixed_sol, True if the puzzle is solved) with the
+        propagating solver of solve_sudoku
+        '''
+        sol = solve_sudoku(self.fixed_sol)
+        if sol is None:
+            return False
+        self.fixed_sol[:] = sol
+        self.__fixed_cands.clear()
+        self.__board = None
+        return True
 
     def solve_backtrack(self):
+        self.__board = None
+        self.__fixed_cands.clear()
         find = self.find_empty(self.fixed_sol)
         if not find:
             return True
         i, j = find
         
-        cand = self.__get_cand__(i, j)
+        cand = self.__get_cand__(i, j, self.fixed_sol)
         for k in list(cand):
             self.fixed_sol[i][j] = k    
             if self.solve_backtrack():
@@ -131,26 +319,191 @@ class Sudoku(ProblemBase):
     def print(self, sol=None):
         if sol is None:
             sol = self.fixed_sol
+        n, b = self.__n, self.__box
+        # width of a digit, and of a cell with its separator
+        d = len(str(n))
+        w = d + 5
         
-        for i in range(54):
-            chr = '▄' if i == 0 else '▄' if i%18 == 0 else '┬' if i%6==0 else '■'
+        for i in range(n*w):
+            chr = '▄' if i == 0 else '▄' if i%(b*w) == 0 else '┬' if i%w==0 else '■'
             print(chr, end='')
         print('▄')
-        for i in range(9):
+        for i in range(n):
             print('█', end='')
-            for j in range(9):
-                val = '\033[1m\033[4m\033[91m' + str(sol[i][j]) + '\033[0m' if self.fixed_vals[i][j] else '\033[1m\033[4m\033[92m' + str(sol[i][j]) + '\033[0m' if self.fixed_sol[i][j] != 0 else ' ' if sol[i][j] == 0 else sol[i][j]
-                end = '█' if (j+1)%3 == 0 else '|' 
+            for j in range(n):
+                val = '\033[1m\033[4m\033[91m' + str(sol[i][j]).rjust(d) + '\033[0m' if self.fixed_vals[i][j] else '\033[1m\033[4m\033[92m' + str(sol[i][j]).rjust(d) + '\033[0m' if self.fixed_sol[i][j] != 0 else ' '*d if sol[i][j] == 0 else str(sol[i][j]).rjust(d)
+                end = '█' if (j+1)%b == 0 else '|' 
                 print('  %s  ' % val, end=end)
             print()
-            if i<8:
-                for j in range(55):
-                    chr = '█' if j==0 else '█' if j==54 else '█' if j%18 == 0 else'┼' if j%6==0 else '■' if (i+1)%3 == 0 else '─'
+            if i<n-1:
+                for j in range(n*w+1):
+                    chr = '█' if j==0 else '█' if j==n*w else '█' if j%(b*w) == 0 else'┼' if j%w==0 else '■' if (i+1)%b == 0 else '─'
                     print(chr, end='')
                 print()
             else:
-                for i in range(54):
-                    chr = '▀' if i == 0 else '▀' if i%18 == 0 else '┴' if i%6==0 else '■'
+                for i in range(n*w):
+                    chr = '▀' if i == 0 else '▀' if i%(b*w) == 0 else '┴' if i%w==0 else '■'
                     print(chr, end='')
                 print('▀')
- 
\ No newline at end of file
+ 
+
+
+def _unit_layout(n):
+    # cells of each unit (rows, columns, then boxes) and units of each cell of a n x n grid
+    b = math.isqrt(n)
+    cell_units = [(c // n, n + c % n, 2*n + (c // n) // b * b + (c % n) // b) for c in range(n*n)]
+    unit_cells = [[] for _ in range(3*n)]
+    for c, units in enumerate(cell_units):
+        for u in units:
+            unit_cells[u].append(c)
+    return cell_units, unit_cells
+
+
+def _propagate(grid, used, cell_units, unit_cells, full):
+    # places the naked and hidden singles until there are none left, returns the candidate
+    # masks of the empty cells, or None on a contradiction
+    while True:
+        cands, progress = [0] * len(grid), False
+        for c, v in enumerate(grid):
+            if v:
+                continue
+            r, col, b = cell_units[c]
+            m = full & ~(used[r] | used[col] | used[b])
+            if not m:
+                return None
+            if m & (m - 1):
+                cands[c] = m
+            else:
+                grid[c] = m.bit_length()
+                used[r] |= m
+                used[col] |= m
+                used[b] |= m
+                progress = True
+        if progress:
+            continue
+        for u, cells in enumerate(unit_cells):
+            once = twice = 0
+            for c in cells:
+                twice |= once & cands[c]
+                once |= cands[c]
+            if once | used[u] != full:
+                return None
+            hidden = once & ~twice
+            while hidden:
+                bit = hidden & -hidden
+                hidden ^= bit
+                for c in cells:
+                    if cands[c] & bit:
+                        # the cell may already have got it as the hidden single of another unit
+                        if grid[c] == bit.bit_length():
+                            break
+                        r, col, b = cell_units[c]
+                        if grid[c] or (used[r] | used[col] | used[b]) & bit:
+                            return None
+                        grid[c] = bit.bit_length()
+                        used[r] |= bit
+                        used[col] |= bit
+                        used[b] |= bit
+                        progress = True
+                        break
+        if not progress:
+            return cands
+
+
+def solve_sudoku(grid):
+    '''
+    Exact solver for a n x n sudoku (n a square, 0 for the empty cells). The digits are kept as
+    bitmasks of the rows, columns and boxes. Naked and hidden singles are propagated, then the
+    empty cell with the fewest candidates is branched on, with an explicit stack of the states
+    to come back to.
+    Output: the solved grid as a numpy array, None if the puzzle has no solution
+    '''
+    grid = np.asarray(grid)
+    n = grid.shape[0]
+    if grid.shape != (n, n) or math.isqrt(n)**2 != n:
+        raise ValueError("A sudoku grid must be n x n with n a square, got shape " + str(grid.shape))
+    cell_units, unit_cells = _unit_layout(n)
+    full = (1 << n) - 1
+    values = grid.ravel().tolist()
+    used = [0] * (3*n)
+    for c, v in enumerate(values):
+        if v:
+            bit = 1 << (v - 1)
+            for u in cell_units[c]:
+                if used[u] & bit:
+                    return None
+                used[u] |= bit
+
+    # each entry is a state to restore with the cell branched on and the digits left to try
+    stack = []
+    while True:
+        cands = _propagate(values, used, cell_units, unit_cells, full)
+        if cands is not None:
+            best, best_count = None, n + 1
+            for c, m in enumerate(cands):
+                if m:
+                    count = bin(m).count('1')
+                    if count < best_count:
+                        best, best_count = c, count
+                        if count == 2:
+                            break
+            if best is None:
+                return np.array(values, dtype=grid.dtype).reshape(n, n)
+            stack.append((values, used, best, cands[best]))
+        # take the next digit of the last cell that still has one
+        while stack:
+            saved_values, saved_used, c, rest = stack.pop()
+            if rest:
+                bit = rest & -rest
+                stack.append((saved_values, saved_used, c, rest ^ bit))
+                values, used = saved_values[:], saved_used[:]
+                values[c] = bit.bit_length()
+                for u in cell_units[c]:
+                    used[u] |= bit
+                break
+        else:
+            return None
+
+
+def _puzzle_size(line):
+    # n of a line of n*n cells, n being the square of the box size
+    n = math.isqrt(len(line))
+    if n*n != len(line) or math.isqrt(n)**2 != n:
+        raise ValueError("A puzzle line must have n*n cells with n a square, got " + str(len(line)) + " characters")
+    return n
+
+
+def _parse_puzzle(line):
+    n = _puzzle_size(line)
+    return np.array([0 if ch == '.' else DIGITS.index(ch.upper()) for ch in line], dtype=np.uint8).reshape(n, n)
+
+
+def _solve_line(line):
+    return solve_sudoku(_parse_puzzle(line))
+
+
+def solve_sudoku_file(path, n_jobs=1):
+    '''
+    Solves the puzzles of a text file, one per line as its n*n cells row by row ('0' or '.' for
+    the empty cells, then 1-9 and A-Z for the digits above 9). Blank lines and lines starting
+    with '#' are skipped, every line has its own size n. With n_jobs > 1 the puzzles are shared by
+    a pool of n_jobs processes.
+    Output: the uint8 solutions, with 0s for the unsolvable puzzles, as a (n_puzzles, n, n) array
+    if all the puzzles have the same size or as a list of (n, n) arrays otherwise, and a boolean
+    array of the puzzles that were solved
+    '''
+    with open(path) as f:
+        lines = [line.strip() for line in f]
+    lines = [line for line in lines if line and not line.startswith('#')]
+    if n_jobs and n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            sols = list(pool.map(_solve_line, lines, chunksize=max(1, len(lines) // (4 * n_jobs))))
+    else:
+        sols = [_solve_line(line) for line in lines]
+    sizes = [_puzzle_size(line) for line in lines]
+    solved = np.array([sol is not None for sol in sols], dtype=bool)
+    solutions = [sol if sol is not None else np.zeros((n, n), dtype=np.uint8) for sol, n in zip(sols, sizes)]
+    if len(set(sizes)) > 1:
+        return solutions, solved
+    n = sizes[0] if sizes else 9
+    return np.array(solutions, dtype=np.uint8).reshape(len(solutions), n, n), solved
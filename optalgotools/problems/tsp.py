@@ -1,7 +1,7 @@
-from .__problem_base import ProblemBase
+from .__problem_base import ProblemBase, zobrist_table, zobrist_hash, swap_deltas, reverse_deltas
 import urllib.request  # the lib that handles the url stuff
-import random
 import math
+import numpy as np
 import matplotlib.pyplot as plt
 
 class TSP(ProblemBase):
@@ -30,6 +30,10 @@ class TSP(ProblemBase):
                             'insert':       pick a random city and remove from the path
                                             and re-inserting it in before a different random
                                             city
+                            'random_swap' (with num_swaps=1), 'reverse' and 'insert' also
+                            support the move protocol of ProblemBase, so the algorithms
+                            can score a neighbour from the few edges it changes. The moves
+                            keep city 0 at the start of the path.
     loop                    By default it's true which means that the path starts and ends
                             from the same city.
     init_method             It support two methods of initializing the path, either:
@@ -39,9 +43,10 @@ class TSP(ProblemBase):
                                             by selecting the pairwise shortest distances 
                                             between citis. This will not leed to the shortest
                                             path but it much better than the random
+    seed                    seed of the problem's random streams (see ProblemBase.seed_rng)
     '''
-    def __init__(self, load_tsp_file=None, load_tsp_url=None, dists=None, gen_method=None, loop=True, **kargs) -> None:
-        super().__init__()
+    def __init__(self, load_tsp_file=None, load_tsp_url=None, dists=None, gen_method=None, loop=True, seed=None, **kargs) -> None:
+        super().__init__(seed)
         
         self.cities = []
         if load_tsp_file:
@@ -54,6 +59,10 @@ class TSP(ProblemBase):
         
         self.dists = dists
         self.n = len(dists)
+        # Zobrist keys for fingerprint(), (n+1) positions x n cities, built on first use
+        self.__zobrist = None
+        # numpy copy of dists for neighbourhood_deltas, built on first use
+        self.__dists_array = None
         
         if self.dists is None:
             raise ValueError("Distance matrix with size nxn is required (or tsp file)!")
@@ -86,6 +95,9 @@ class TSP(ProblemBase):
                     self.rev_len = 2
                 else:
                     self.rev_len = kargs['rev_len']
+            # A reversed segment keeps its inner edges only if the distances are symmetric
+            self.symmetric = all(self.dists[i][j] == self.dists[j][i] 
+                                 for i in range(self.n) for j in range(i+1, self.n))
         
     @staticmethod
     def load_tsp_from_file(file_path):
@@ -125,7 +137,7 @@ class TSP(ProblemBase):
     def get_init_solution(self):
         sol = None
         if self.init_method == 'random':
-            sol = random.sample(range(self.n), self.n)
+            sol = self.random.sample(range(self.n), self.n)
         elif self.init_method == 'greedy':
             mini_dist = 10000000
             min_i, min_j = -1, -1
@@ -162,13 +174,13 @@ class TSP(ProblemBase):
             
         if self.gen_method == "random_swap":
             for i in range(self.num_swaps):
-                c1 = random.randrange(self.n)
+                c1 = self.random.randrange(self.n)
                 c2 = c1
                 while c2 == c1:
                     if not self.swap_wind:
-                        c2 = random.randrange(self.n)
+                        c2 = self.random.randrange(self.n)
                     else:
-                        c2 = random.randrange(c1-self.swap_wind, c1+self.swap_wind+1)
+                        c2 = self.random.randrange(c1-self.swap_wind, c1+self.swap_wind+1)
                         if c2<0:
                             c2+=self.n
                         elif c2>=self.n:
@@ -181,10 +193,10 @@ class TSP(ProblemBase):
         
         elif self.gen_method == 'reverse':
             if self.rand_len:
-                l = random.randint(2, self.n - 1)
+                l = self.random.randint(2, self.n - 1)
             else:
                 l = self.rev_len
-            c1 =  random.randrange(self.n - l)
+            c1 =  self.random.randrange(self.n - l)
             sol[c1 : (c1 + l)] = reversed(sol[c1 : (c1 + l)])
             
             # To fit the requirement of starting and ending at 0
@@ -192,23 +204,23 @@ class TSP(ProblemBase):
             return sol[index_of_zero:]+ sol[:index_of_zero] + [0]
         
         elif self.gen_method == 'mutate':
-            l = random.randint(1, (self.n - 1) //5)
-            c1 = random.randrange(self.n - l)
+            l = self.random.randint(1, (self.n - 1) //5)
+            c1 = self.random.randrange(self.n - l)
             x = sol[c1 : (c1 + l)]
             sol = sol[:min(self.n, c1)] + sol[min(self.n, c1 + l):]
-            random.shuffle(x)
+            self.random.shuffle(x)
             for e in x:
-                sol.insert(random.randint(0,len(sol)),e)
+                sol.insert(self.random.randint(0,len(sol)),e)
                 
             # To fit the requirement of starting and ending at 0
             index_of_zero = sol.index(0)
             return sol[index_of_zero:]+ sol[:index_of_zero] + [0]
         
         elif self.gen_method == 'insert':
-            c1 = random.randrange(self.n)
+            c1 = self.random.randrange(self.n)
             c2 = c1
             while c2 == c1:
-                c2 = random.randrange(self.n)
+                c2 = self.random.randrange(self.n)
             sol.insert(c1, sol[c2])
             if c1 < c2:
                 c2 += 1
@@ -230,6 +242,149 @@ class TSP(ProblemBase):
         return cost
 
 
+    def supports_moves(self):
+        if self.gen_method == 'random_swap':
+            return self.num_swaps == 1
+        return self.gen_method in ('reverse', 'insert')
+
+    def propose_move(self, sol):
+        # Positions are in 1..n-1 so that city 0 stays at the start (and end) of the path
+        if self.gen_method == 'random_swap':
+            c1 = self.random.randrange(1, self.n)
+            c2 = c1
+            while c2 == c1 or c2 == 0:
+                if not self.swap_wind:
+                    c2 = self.random.randrange(1, self.n)
+                else:
+                    c2 = self.random.randrange(c1-self.swap_wind, c1+self.swap_wind+1)
+                    if c2<0:
+                        c2+=self.n
+                    elif c2>=self.n:
+                        c2-=self.n
+            return ('swap', min(c1, c2), max(c1, c2))
+
+        elif self.gen_method == 'reverse':
+            if self.rand_len:
+                l = self.random.randint(2, self.n - 1)
+            else:
+                l = self.rev_len
+            c1 = self.random.randrange(1, self.n - l + 1)
+            return ('reverse', c1, c1 + l - 1)
+
+        elif self.gen_method == 'insert':
+            c1 = self.random.randrange(1, self.n)
+            c2 = c1
+            while c2 == c1:
+                c2 = self.random.randrange(1, self.n)
+            return ('insert', c2, c1)
+
+    def __edge(self, sol, i, a, b):
+        # edge i links positions i and i+1, the last one only counts for a loop
+        if i < self.n - (0 if self.loop else 1):
+            return self.dists[a][b]
+        return 0
+
+    def move_delta(self, sol, move):
+        kind, i, j = move
+        e = self.__edge
+        if kind == 'swap':
+            a, b = sol[i], sol[j]
+            if j == i + 1:
+                return (e(sol, i-1, sol[i-1], b) + e(sol, i, b, a) + e(sol, j, a, sol[j+1]) -
+                        e(sol, i-1, sol[i-1], a) - e(sol, i, a, b) - e(sol, j, b, sol[j+1]))
+            return (e(sol, i-1, sol[i-1], b) + e(sol, i, b, sol[i+1]) +
+                    e(sol, j-1, sol[j-1], a) + e(sol, j, a, sol[j+1]) -
+                    e(sol, i-1, sol[i-1], a) - e(sol, i, a, sol[i+1]) -
+                    e(sol, j-1, sol[j-1], b) - e(sol, j, b, sol[j+1]))
+
+        elif kind == 'reverse':
+            delta = (e(sol, i-1, sol[i-1], sol[j]) + e(sol, j, sol[i], sol[j+1]) -
+                     e(sol, i-1, sol[i-1], sol[i]) - e(sol, j, sol[j], sol[j+1]))
+            if not self.symmetric:
+                for k in range(i, j):
+                    delta += self.dists[sol[k+1]][sol[k]] - self.dists[sol[k]][sol[k+1]]
+            return delta
+
+        elif kind == 'insert':
+            # the city at position i is moved to position j
+            x = sol[i]
+            if i < j:
+                return (e(sol, i-1, sol[i-1], sol[i+1]) + e(sol, j-1, sol[j], x) + e(sol, j, x, sol[j+1]) -
+                        e(sol, i-1, sol[i-1], x) - e(sol, i, x, sol[i+1]) - e(sol, j, sol[j], sol[j+1]))
+            return (e(sol, j-1, sol[j-1], x) + e(sol, j, x, sol[j]) + e(sol, i, sol[i-1], sol[i+1]) -
+                    e(sol, j-1, sol[j-1], sol[j]) - e(sol, i-1, sol[i-1], x) - e(sol, i, x, sol[i+1]))
+
+        raise ValueError("Undefined move " + str(kind))
+
+    def apply_move(self, sol, move):
+        kind, i, j = move
+        if kind == 'swap':
+            sol[i], sol[j] = sol[j], sol[i]
+        elif kind == 'reverse':
+            sol[i : j + 1] = sol[i : j + 1][::-1]
+        elif kind == 'insert':
+            sol.insert(j, sol.pop(i))
+        else:
+            raise ValueError("Undefined move " + str(kind))
+        return sol
+
+    def supports_neighbourhood_deltas(self):
+        if self.gen_method == 'random_swap':
+            return self.num_swaps == 1
+        return self.gen_method == 'reverse'
+
+    def neighbourhood_deltas(self, sol):
+        # every swap (within swap_wind if set) or every reversal (of any length) of positions 1..n-1
+        if self.__dists_array is None:
+            self.__dists_array = np.asarray(self.dists, dtype=float)
+        weights = np.ones(self.n)
+        if not self.loop:
+            weights[-1] = 0
+        path = np.asarray(sol)
+        if self.gen_method == 'reverse':
+            deltas = reverse_deltas(self.__dists_array, path, weights)[:self.n, :self.n]
+        else:
+            deltas = swap_deltas(self.__dists_array, path, weights)[:self.n, :self.n]
+            if self.swap_wind:
+                gap = np.abs(np.subtract.outer(np.arange(self.n), np.arange(self.n)))
+                deltas[np.minimum(gap, self.n - gap) > self.swap_wind] = np.nan
+        return deltas
+
+    def neighbourhood_move(self, i, j):
+        return ('reverse' if self.gen_method == 'reverse' else 'swap', i, j)
+
+    def __zobrist_keys(self):
+        if self.__zobrist is None:
+            self.__zobrist = zobrist_table(self.n + 1, self.n)
+        return self.__zobrist
+
+    def fingerprint(self, sol):
+        return zobrist_hash(self.__zobrist_keys(), sol)
+
+    def move_fingerprint(self, sol, move, fp):
+        # only the positions the move changes are updated, O(1) for a swap
+        kind, i, j = move
+        z = self.__zobrist_keys()
+        if kind == 'swap':
+            a, b = sol[i], sol[j]
+            return fp ^ int(z[i][a] ^ z[i][b] ^ z[j][b] ^ z[j][a])
+        if kind == 'reverse':
+            lo, hi, seg = i, j, sol[i : j + 1]
+            moved = seg[::-1]
+        elif kind == 'insert':
+            lo, hi = min(i, j), max(i, j)
+            seg = sol[lo : hi + 1]
+            moved = seg[1:] + seg[:1] if i < j else seg[-1:] + seg[:-1]
+        else:
+            raise ValueError("Undefined move " + str(kind))
+        if isinstance(z, np.ndarray):
+            # large instances, the keys of the segment are xored in one numpy reduction
+            k = np.arange(lo, hi + 1)
+            return fp ^ int(np.bitwise_xor.reduce(z[k, seg] ^ z[k, moved]))
+        for k in range(lo, hi + 1):
+            fp ^= z[k][seg[k - lo]] ^ z[k][moved[k - lo]]
+        return fp
+
     def plot(self, path):
         # Unpack the primary TSP path and transform it into a list of ordered
         # coordinates
@@ -172,25 +172,46 @@ def randomized_search(G, source, destination):
     raise Exception("destination and source are not on same component")
 
 
-def astar_heuristic(G, origin, destination, measuring_dist = straight_line):
-    distanceGoal = dict()
-    distanceOrigin = dict()
+class LazyDistances(dict):
+    '''
+    Straight-line distances between the point (x, y) and the nodes of G, each one is computed the
+    first time it is read and then kept. to_point measures from the node to the point instead of
+    from the point to the node
+    '''
+    def __init__(self, G, x, y, measuring_dist=straight_line, to_point=False):
+        super().__init__()
+        self.G, self.x, self.y = G, x, y
+        self.measuring_dist = measuring_dist
+        self.to_point = to_point
+
+    def __missing__(self, node):
+        pointX = self.G.nodes[node]['x']
+        pointY = self.G.nodes[node]['y']
+        if self.to_point:
+            dist = self.measuring_dist(pointX, pointY, self.x, self.y)
+        else:
+            dist = self.measuring_dist(self.x, self.y, pointX, pointY)
+        self[node] = dist
+        return dist
+
+
+'''
+G: networkx.Graph whose nodes have 'x' and 'y' coordinates
+origin, destination: Nodes of G
+measuring_dist: function of (x1, y1, x2, y2) giving the distance between two points
 
+Output: the straight-line distances of the nodes from the origin and to the destination, as
+LazyDistances, so only the distances of the nodes a search reaches are computed
+'''
+def astar_heuristic(G, origin, destination, measuring_dist = straight_line):
     originX = G.nodes[origin.get_id()]['x']
     originY = G.nodes[origin.get_id()]['y']
 
     destX = G.nodes[destination.get_id()]['x']
     destY = G.nodes[destination.get_id()]['y']
 
-    for node in G:
-        pointX = G.nodes[node]['x']
-        pointY = G.nodes[node]['y']
-
-        originDist = measuring_dist(originX, originY, pointX, pointY)
-        destDist = measuring_dist(pointX, pointY, destX, destY)
-
-        distanceGoal[node] = originDist
-        distanceOrigin[node] = destDist
+    distanceGoal = LazyDistances(G, originX, originY, measuring_dist)
+    distanceOrigin = LazyDistances(G, destX, destY, measuring_dist, to_point=True)
 
     return distanceGoal, distanceOrigin
 
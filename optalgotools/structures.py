@@ -2,6 +2,7 @@
 This module contains the base classes used in the book.
 
 '''
+import numpy as np
 
 class Node:
     # using __slots__ for optimization
@@ -79,6 +80,148 @@ class Node:
         return hash(self.osmid)
 
 
+class CSRGraph:
+    '''
+    Compressed sparse row snapshot of a networkx (or osmnx) graph, built once, for the searches
+    of graph_search. The out-edges of the node of index i are targets[offsets[i]:offsets[i+1]]
+    with weights[offsets[i]:offsets[i+1]] (int32 offsets and targets, float64 weights, about 12
+    bytes per edge), ids and index map the node indices to the graph ids and back.
+    Parallel edges keep the lowest weight, undirected graphs get both directions of every edge,
+    the in-edges of directed graphs (reverse searches) are built from the out-edges the first time
+    they are needed, another 12 bytes per edge. The 'x' and 'y'
+    of the nodes are kept in x and y (nan when missing) for the heuristics.
+    attr_name               the edge attribute used as weight, 1 when an edge does not have it
+    '''
+    def __init__(self, G, attr_name='length'):
+        self.attr_name = attr_name
+        self.ids = list(G.nodes)
+        self.index = {osmid: k for k, osmid in enumerate(self.ids)}
+        n = len(self.ids)
+        edges = G.edges(data=attr_name, default=1)
+        src = np.fromiter((self.index[u] for u, _, _ in edges), dtype=np.int64, count=len(edges))
+        dst = np.fromiter((self.index[v] for _, v, _ in edges), dtype=np.int64, count=len(edges))
+        weights = np.fromiter((w for _, _, w in edges), dtype=np.float64, count=len(edges))
+        if not G.is_directed():
+            src, dst = np.concatenate((src, dst)), np.concatenate((dst, src))
+            weights = np.concatenate((weights, weights))
+        self.offsets, self.targets, self.weights = self.__compress(n, src, dst, weights)
+        self.directed = G.is_directed()
+        self.__in_offsets, self.__in_targets, self.__in_weights = [None] * 3
+        self.x = np.array([G.nodes[osmid].get('x', np.nan) for osmid in self.ids], dtype=np.float64)
+        self.y = np.array([G.nodes[osmid].get('y', np.nan) for osmid in self.ids], dtype=np.float64)
+        self.graph = dict(G.graph)
+
+    @staticmethod
+    def __compress(n, src, dst, weights):
+        # sorted by source, then target, then weight, the first of each (source, target) is kept
+        order = np.lexsort((weights, dst, src))
+        src, dst, weights = src[order], dst[order], weights[order]
+        keep = np.ones(len(src), dtype=bool)
+        keep[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+        src, dst, weights = src[keep], dst[keep], weights[keep]
+        offsets = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(src, minlength=n), out=offsets[1:])
+        return offsets, dst.astype(np.int32), weights
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def n_edges(self):
+        return len(self.targets)
+
+    def neighbours(self, k, reverse=False):
+        '''
+        Indices and weights of the out-edges of the node of index k (in-edges with reverse)
+        '''
+        if reverse:
+            offsets, targets, weights = self.in_edges()
+        else:
+            offsets, targets, weights = self.offsets, self.targets, self.weights
+        a, b = offsets[k], offsets[k + 1]
+        return targets[a:b], weights[a:b]
+
+    def in_edges(self):
+        '''
+        The CSR arrays of the reversed graph, (offsets, targets, weights)
+        '''
+        if not self.directed:
+            # the in-edges are the out-edges
+            return self.offsets, self.targets, self.weights
+        if self.__in_offsets is None:
+            # rebuilt from the forward arrays, so the snapshot keeps no edge list around
+            n = len(self.ids)
+            src = np.repeat(np.arange(n, dtype=np.int32), np.diff(self.offsets))
+            self.__in_offsets, self.__in_targets, self.__in_weights = self.__compress(n, self.targets, src, self.weights)
+        return self.__in_offsets, self.__in_targets, self.__in_weights
+
+    def node(self, osmid):
+        return CSRNode(self, self.index[osmid])
+
+    def path(self, parent, k):
+        '''
+        Ids of the route from the origin to the node of index k, parent maps the index of every
+        reached node to the index of its parent (-1 for the origin)
+        '''
+        path = []
+        while k != -1:
+            path.append(self.ids[k])
+            k = parent[k]
+        return path[::-1]
+
+
+class CSRNode:
+    '''
+    Node of a CSRGraph with the interface of Node, so the searches of graph_search run on the
+    snapshot unchanged. get_id() and path() give the ids of the original graph, the children of
+    expand() are read from a slice of the CSR arrays.
+    '''
+    __slots__ = ['graph', 'k', 'distance', 'parent']
+    def __init__(self, graph, k, distance=0, parent=None):
+        self.graph = graph
+        # index of the node in the CSR arrays
+        self.k = k
+        self.distance = distance
+        self.parent = parent
+
+    def get_id(self):
+        return self.graph.ids[self.k]
+
+    def get_distance(self):
+        return self.distance
+
+    def set_distance(self, distance):
+        self.distance = distance
+
+    def set_parent(self, parent):
+        self.parent = parent
+
+    def expand(self, reverse=False, attr_name=None):
+        if attr_name is not None and attr_name != self.graph.attr_name:
+            raise ValueError("The CSRGraph weights are " + str(self.graph.attr_name) + ", not " + str(attr_name))
+        targets, weights = self.graph.neighbours(self.k, reverse)
+        return [CSRNode(self.graph, k, w, self) for k, w in zip(targets.tolist(), weights.tolist())]
+
+    def path(self):
+        node = self
+        path = []
+        while node:
+            path.append(node.get_id())
+            node = node.parent
+        return path[::-1]
+
+    def __eq__(self, other):
+        if isinstance(other, CSRNode):
+            return self.k == other.k and self.graph is other.graph
+        try:
+            return self.get_id() == other.osmid
+        except:
+            return self.get_id() == other
+
+    def __hash__(self):
+        return hash(self.get_id())
+
+
 class Solution:
     def __init__(self, result, time, space, explored):
         self.result = result
@@ -86,4 +229,101 @@ class Solution:
         self.space = space
         self.explored = explored
 
-        
\ No newline at end of file
+        
+
+
+class IndexedMinHeap:
+    '''
+    Binary min-heap of keys with a position map, so a key can be found, updated or removed in
+    O(log n) instead of scanning the heap. Each key is in the heap at most once, with a priority
+    (any comparable value, e.g. a (cost, entry count) tuple) and an optional item.
+    '''
+    def __init__(self):
+        self.keys = []
+        self.pos = dict()
+        self.priorities = dict()
+        self.items = dict()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.pos
+
+    def priority(self, key):
+        return self.priorities[key]
+
+    def item(self, key):
+        return self.items[key]
+
+    def peek(self):
+        key = self.keys[0]
+        return key, self.priorities[key], self.items[key]
+
+    def push(self, key, priority, item=None):
+        '''
+        Inserts key, or changes its priority (and item) if it is already in the heap
+        '''
+        self.items[key] = item
+        if key in self.pos:
+            old = self.priorities[key]
+            self.priorities[key] = priority
+            if priority < old:
+                self.__sift_up(self.pos[key])
+            else:
+                self.__sift_down(self.pos[key])
+            return
+        self.priorities[key] = priority
+        self.pos[key] = len(self.keys)
+        self.keys.append(key)
+        self.__sift_up(len(self.keys) - 1)
+
+    def pop(self):
+        '''
+        Removes and returns (key, priority, item) of the key with the lowest priority
+        '''
+        key = self.keys[0]
+        entry = key, self.priorities[key], self.items[key]
+        self.remove(key)
+        return entry
+
+    def remove(self, key):
+        # the last key takes the place of the removed one, then moves up or down
+        del self.priorities[key], self.items[key]
+        k = self.pos.pop(key)
+        last = self.keys.pop()
+        if k < len(self.keys):
+            self.keys[k] = last
+            self.pos[last] = k
+            self.__sift_up(k)
+            self.__sift_down(self.pos[last])
+
+    def __sift_up(self, k):
+        keys, pos, prio = self.keys, self.pos, self.priorities
+        key = keys[k]
+        while k > 0:
+            parent = (k - 1) >> 1
+            if not prio[key] < prio[keys[parent]]:
+                break
+            keys[k] = keys[parent]
+            pos[keys[k]] = k
+            k = parent
+        keys[k] = key
+        pos[key] = k
+
+    def __sift_down(self, k):
+        keys, pos, prio = self.keys, self.pos, self.priorities
+        key, n = keys[k], len(keys)
+        while True:
+            child = 2 * k + 1
+            if child >= n:
+                break
+            if child + 1 < n and prio[keys[child + 1]] < prio[keys[child]]:
+                child += 1
+            if not prio[keys[child]] < prio[key]:
+                break
+            keys[k] = keys[child]
+            pos[keys[k]] = k
+            k = child
+        keys[k] = key
+        pos[key] = k
@@ -1,4 +1,6 @@
 import math
+import random
+import numpy as np
 '''
 paths: List of Leaflet AntPaths
 
@@ -23,4 +25,54 @@ def haversine_distance(lon1, lat1, lon2, lat2):
     a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
     c = 2 * math.asin(math.sqrt(a)) 
     r = 6371 # Radius of earth in kilometers. Use 3956 for miles
-    return c * r
\ No newline at end of file
+    return c * r
+
+'''
+lon1, lat1: numpy arrays (or scalars) of coordinates
+lon2, lat2: coordinates to measure to, broadcast against lon1 and lat1
+
+Output: the straight_line distances as a numpy array
+'''
+def straight_line_array(lon1, lat1, lon2, lat2):
+    return np.hypot(np.subtract(lon2, lon1), np.subtract(lat2, lat1))
+
+'''
+lon1, lat1: numpy arrays (or scalars) of longitudes and latitudes in decimal degrees
+lon2, lat2: longitudes and latitudes to measure to, broadcast against lon1 and lat1
+r: radius of the earth in the unit of the output, 6371 for kilometers (as haversine_distance),
+   6371000 for meters (as the 'length' of the osmnx edges)
+
+Output: the haversine_distance of every pair as a numpy array
+'''
+def haversine_array(lon1, lat1, lon2, lat2, r=6371):
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1)/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1)/2)**2
+    return 2 * r * np.arcsin(np.sqrt(a))
+
+'''
+seed: None, an int, a numpy SeedSequence or a numpy Generator
+
+Output: a numpy Generator and a random.Random seeded from it. The Generator is the source of
+the random stream, the random.Random serves the scalar draws of the hot loops (e.g. one
+randrange per neighbour) where it is several times cheaper per call. With seed=None the seed
+is drawn from the global np.random, so np.random.seed() still makes a run reproducible.
+'''
+def make_rngs(seed=None):
+    if seed is None:
+        seed = np.random.randint(2**32, dtype=np.int64)
+    rng = seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+    return rng, random.Random(int(rng.integers(2**63)))
+
+'''
+seed: an int or a numpy SeedSequence
+n: number of streams
+
+Output: n independent SeedSequence spawned from seed, the same seed always gives the same
+children (a SeedSequence given as seed is not advanced)
+'''
+def spawn_seeds(seed, n):
+    if isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key, pool_size=seed.pool_size)
+    else:
+        seed = np.random.SeedSequence(seed)
+    return seed.spawn(n)
@@ -0,0 +1,47 @@
+import random
+
+from optalgotools.algorithms._memory import FrequencyMemory
+
+
+def _long_run(memory, n_moves=100000, seed=0):
+    # moves taken once each, then one move taken again and again, as in a cycle of the search
+    rng = random.Random(seed)
+    for _ in range(n_moves):
+        memory.add(rng.getrandbits(48))
+    for _ in range(20):
+        memory.add(('cycle', 0))
+        for _ in range(9):
+            memory.add(rng.getrandbits(48))
+
+
+def test_decayed_sketch_keeps_a_bounded_error():
+    memory = FrequencyMemory(width=256)
+    _long_run(memory)
+    assert memory.total < 256 / (1 - memory.decay) + 1
+    assert memory.error() < 2 * 2.72
+
+
+def test_frequent_move_is_seen_after_a_long_run():
+    memory = FrequencyMemory(width=256)
+    _long_run(memory)
+    assert memory.seen(('cycle', 0))
+    # the long term test of TabuSearch lets a seen move through with probability frequency
+    assert memory.frequency(('cycle', 0)) < 0.2
+    # and most of the moves never taken still count as such
+    assert sum(memory.seen(('never', k)) for k in range(1000)) < 50
+
+
+def test_undecayed_sketch_drifts():
+    memory = FrequencyMemory(width=256, decay=None)
+    _long_run(memory)
+    assert memory.error() > 1000
+    assert not memory.seen(('cycle', 0))
+
+
+def test_exact_memory_counts():
+    memory = FrequencyMemory(shape=(3, 3), decay=None)
+    for _ in range(4):
+        memory.add((0, 1))
+    memory.add((2, 2))
+    assert memory.count((0, 1)) == 4 and memory.seen((0, 1)) and not memory.seen((1, 1))
+    assert memory.frequencies()[2, 2] == 0.2